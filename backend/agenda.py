@@ -0,0 +1,440 @@
+# backend/agenda.py
+"""
+Modelo de horarios de la agenda sobre máscaras de bits (un bit por slot).
+
+- DEFAULT_SLOTS ocupan los bits 0..14 en orden; un override con un horario fuera de
+  la grilla (ej. "08:30") recibe el siguiente bit libre la primera vez que aparece.
+- Overrides, bookings y reglas de bloqueo se convierten a int y el día se resuelve
+  con un par de operaciones de bits: (base & ~ocupados & ~bloqueados).
+- slots_de_mask vuelve a la lista "HH:MM" (orden horario) solo para la respuesta.
+- Los bookings son intervalos [time, time + duration_min): ocupan todos los slots que
+  tocan, y un inicio se ofrece solo si la duración pedida entra antes del próximo
+  ocupado (k corrimientos de bits por día, sin recorrer slots).
+- BlockRuleIndex: reglas de bloqueo compiladas una vez a tramos de fechas -> máscara;
+  consultar un día es un bisect, no un recorrido de reglas x slots.
+- availability_cache: respuesta del calendario público por mes, invalidada por los
+  commits que tocan bookings / holds / overrides / reglas.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect
+from sqlmodel import Session, select
+
+from .models.models import dbBlockRule, dbGlobalConfig, dbBooking, dbAvailabilityOverride, dbSlotHold
+from .config_manager import CONFIG_REVALIDATE_S
+
+DEFAULT_SLOTS = [
+    "08:00", "09:00", "10:00", "11:00", "12:00",
+    "13:00", "14:00", "15:00", "16:00", "17:00",
+    "18:00", "19:00", "20:00", "21:00", "22:00"
+]
+
+_bits: Dict[str, int] = {s: i for i, s in enumerate(DEFAULT_SLOTS)}
+_bits_lock = threading.Lock()
+
+# Todos los horarios de la grilla por defecto
+FULL_MASK = (1 << len(DEFAULT_SLOTS)) - 1
+
+
+def slot_bit(slot: str) -> int:
+    """Bit asignado al horario (registra los que no están en DEFAULT_SLOTS)."""
+    b = _bits.get(slot)
+    if b is None:
+        with _bits_lock:
+            b = _bits.get(slot)
+            if b is None:
+                b = len(_bits)
+                _bits[slot] = b
+    return b
+
+
+def mask_de_slots(slots: Optional[Iterable[str]]) -> int:
+    mask = 0
+    for s in slots or ():
+        if s:
+            mask |= 1 << slot_bit(s)
+    return mask
+
+
+@lru_cache(maxsize=8192)
+def slots_de_mask(mask: int) -> Tuple[str, ...]:
+    """Horarios (orden horario) de una máscara. Tupla porque el resultado queda cacheado."""
+    out = []
+    while mask:
+        low = mask & -mask
+        out.append(low.bit_length() - 1)
+        mask ^= low
+    if out and out[-1] >= len(DEFAULT_SLOTS):
+        nombres = {b: s for s, b in list(_bits.items())}
+        return tuple(sorted(nombres[b] for b in out))
+    return tuple(DEFAULT_SLOTS[b] for b in out)
+
+
+@lru_cache(maxsize=1024)
+def mask_rango(hour_from: str, hour_to: str) -> int:
+    """Slots de DEFAULT_SLOTS dentro de [hour_from, hour_to] (comparación HH:MM como en las reglas)."""
+    mask = 0
+    for i, s in enumerate(DEFAULT_SLOTS):
+        if hour_from <= s <= hour_to:
+            mask |= 1 << i
+    return mask
+
+
+# Duración de cada slot de DEFAULT_SLOTS (la grilla es horaria)
+SLOT_MIN = 60
+
+
+def _minutos(hhmm: str) -> Optional[int]:
+    try:
+        h, m = hhmm.split(":")
+        return int(h) * 60 + int(m)
+    except (AttributeError, ValueError):
+        return None
+
+
+def mask_intervalo(start: str, duration_min: int) -> int:
+    """
+    Slots que ocupa un trabajo que arranca en start y dura duration_min:
+    su propio bit + todo slot cuyo [inicio, inicio + SLOT_MIN) se superpone.
+    """
+    return _mask_intervalo(start, int(duration_min or SLOT_MIN), len(_bits))
+
+
+@lru_cache(maxsize=4096)
+def _mask_intervalo(start: str, duration_min: int, _n_bits: int) -> int:
+    # _n_bits en la clave: si aparece un horario fuera de grilla nuevo, se recalcula
+    mask = 1 << slot_bit(start)
+    ini = _minutos(start)
+    if ini is None:
+        return mask
+    fin = ini + max(duration_min, 1)
+    for s, b in list(_bits.items()):
+        a = _minutos(s)
+        if a is not None and a < fin and ini < a + SLOT_MIN:
+            mask |= 1 << b
+    return mask
+
+
+def slots_necesarios(duration_min: Optional[int]) -> int:
+    """Cuántos slots consecutivos de la grilla ocupa un trabajo de esa duración (mínimo 1)."""
+    if not duration_min or duration_min <= SLOT_MIN:
+        return 1
+    return min(-(-int(duration_min) // SLOT_MIN), len(DEFAULT_SLOTS))
+
+
+def mask_inicios_bloqueados(ocupado: int, k: int) -> int:
+    """
+    Inicios de la grilla donde un trabajo de k slots choca con lo ocupado:
+    s queda bloqueado si alguno de s..s+k-1 está ocupado (OR de k corrimientos).
+    """
+    grilla = ocupado & FULL_MASK
+    bloqueados = ocupado
+    for j in range(1, k):
+        bloqueados |= grilla >> j
+    return bloqueados
+
+
+def inicios_fuera_de_grilla_libres(base: int, ocupado: int, duration_min: int) -> int:
+    """Para los horarios fuera de grilla del día (raros): chequeo de intervalo uno por uno."""
+    extra = base & ~FULL_MASK
+    libres = 0
+    while extra:
+        low = extra & -extra
+        extra ^= low
+        slot = slots_de_mask(low)[0]
+        if not (mask_intervalo(slot, duration_min) & ocupado):
+            libres |= low
+    return libres
+
+
+def mask_base_dia(ovr) -> int:
+    """Horarios que ofrece el día según el override del admin (o la grilla por defecto)."""
+    if ovr is None:
+        return FULL_MASK
+    if not ovr.enabled:
+        return 0
+    return mask_de_slots(ovr.slots) if ovr.slots else FULL_MASK
+
+
+class _ReglasSnapshot:
+    """
+    Reglas de bloqueo compiladas:
+    - bounds/masks: tramos de fechas [bounds[i], bounds[i+1]) -> máscara bloqueada.
+    - mask_all: reglas apply_all (aplican desde hoy en adelante, hoy se evalúa al consultar).
+    """
+    __slots__ = ("bounds", "masks", "mask_all", "enabled", "rules", "updated_at", "checked_at")
+
+    def __init__(self, rules, enabled: bool, updated_at: Optional[datetime]):
+        self.enabled = enabled
+        self.rules = len(rules)
+        self.updated_at = updated_at
+        self.checked_at = time.monotonic()
+
+        mask_all = 0
+        rangos = []
+        for rule in rules:
+            hf, ht = rule.hour_from, rule.hour_to
+            if not hf or not ht:
+                continue
+            m = mask_rango(hf, ht)
+            if not m:
+                continue
+            if rule.apply_all:
+                mask_all |= m
+                continue
+            df, dt = rule.date_from, rule.date_to
+            if not df or not dt or df > dt:
+                continue
+            # Intervalo semiabierto sin parsear fechas: x <= dt  <=>  x < dt + "\0"
+            rangos.append((df, dt + "\0", m))
+
+        bounds = sorted({b for df, hasta, _ in rangos for b in (df, hasta)})
+        masks = [0] * len(bounds)
+        for df, hasta, m in rangos:
+            for i in range(bisect_left(bounds, df), bisect_left(bounds, hasta)):
+                masks[i] |= m
+        self.bounds = bounds
+        self.masks = masks
+        self.mask_all = mask_all
+
+    def mask_dia(self, date_str: str, today_str: str) -> int:
+        """Slots bloqueados por las reglas en date_str (0 si los bloqueos están desactivados)."""
+        if not self.enabled:
+            return 0
+        mask = self.mask_all if date_str >= today_str else 0
+        i = bisect_right(self.bounds, date_str) - 1
+        if i >= 0:
+            mask |= self.masks[i]
+        return mask
+
+    def masks_rango(self, fechas: Iterable[str], today_str: str) -> Iterable[int]:
+        """mask_dia para fechas consecutivas ascendentes: un solo bisect y después avanza por tramos."""
+        if not self.enabled:
+            for _ in fechas:
+                yield 0
+            return
+        bounds, masks = self.bounds, self.masks
+        i = None
+        for date_str in fechas:
+            if i is None:
+                i = bisect_right(bounds, date_str) - 1
+            while i + 1 < len(bounds) and bounds[i + 1] <= date_str:
+                i += 1
+            mask = self.mask_all if date_str >= today_str else 0
+            if i >= 0:
+                mask |= masks[i]
+            yield mask
+
+
+class BlockRuleIndex:
+    """
+    Índice en memoria de las reglas de bloqueo (por proceso), como DynamicConfig:
+    se compila al crear/borrar reglas o al cambiar blocks_enabled, y los demás workers
+    lo revalidan cada CONFIG_REVALIDATE_S leyendo solo global_configs.updated_at
+    (los endpoints de reglas lo tocan en cada cambio).
+    """
+    _snapshot: Optional[_ReglasSnapshot] = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def rebuild(cls, session: Session) -> _ReglasSnapshot:
+        # Columnas sueltas: updated_at tal cual lo devuelve la DB, igual que en get()
+        cfg = session.exec(
+            select(dbGlobalConfig.blocks_enabled, dbGlobalConfig.updated_at).where(dbGlobalConfig.id == "global_config")
+        ).first()
+        rules = session.exec(select(dbBlockRule)).all()
+        enabled, updated_at = (cfg[0], cfg[1]) if cfg else (True, None)
+        snap = _ReglasSnapshot(rules, enabled, updated_at)
+        with cls._lock:
+            cls._snapshot = snap
+        return snap
+
+    @classmethod
+    def invalidate(cls) -> None:
+        with cls._lock:
+            cls._snapshot = None
+
+    @classmethod
+    def get(cls, session: Session) -> _ReglasSnapshot:
+        snap = cls._snapshot
+        if snap and time.monotonic() - snap.checked_at < CONFIG_REVALIDATE_S:
+            return snap
+        if snap:
+            updated_at = session.exec(
+                select(dbGlobalConfig.updated_at).where(dbGlobalConfig.id == "global_config")
+            ).first()
+            if updated_at == snap.updated_at:
+                snap.checked_at = time.monotonic()
+                return snap
+        return cls.rebuild(session)
+
+
+def touch_block_rules(session: Session) -> dbGlobalConfig:
+    """Marca un cambio en las reglas (updated_at) para que los otros workers recompilen."""
+    cfg = session.exec(select(dbGlobalConfig).where(dbGlobalConfig.id == "global_config")).first()
+    if cfg:
+        cfg.updated_at = datetime.now(timezone.utc)
+    else:
+        cfg = dbGlobalConfig(id="global_config", blocks_enabled=True)
+    session.add(cfg)
+    return cfg
+
+
+# =========================
+# Caché de disponibilidad por mes
+# =========================
+
+AVAILABILITY_CACHE_TTL_S = float(os.getenv("AVAILABILITY_CACHE_TTL_S", "60"))
+
+
+class _MesCacheado:
+    __slots__ = ("days", "body", "etag", "today", "valid_until")
+
+    def __init__(self, days: Dict[str, list], body: bytes, today: str, ttl_s: float):
+        self.days = days
+        self.body = body
+        self.etag = '"' + hashlib.blake2b(body, digest_size=10).hexdigest() + '"'
+        self.today = today
+        self.valid_until = time.monotonic() + ttl_s
+
+
+class AvailabilityCache:
+    """
+    Respuesta ya serializada de /api/availability por mes (+ ETag del contenido).
+
+    - Se invalida exacto: cada commit que toca bookings / overrides invalida solo los
+      meses de esas fechas; reglas de bloqueo o blocks_enabled invalidan todo
+      (ver _registrar_cambios_agenda más abajo).
+    - La entrada vale solo para el "hoy" con que se calculó (las reglas apply_all
+      dependen de la fecha actual).
+    - TTL corto de respaldo por si hay más de un worker (cada uno invalida lo suyo);
+      más corto aún si en el mes vence un hold antes.
+    - Generaciones por mes: si un commit invalida mientras otro request calcula,
+      ese resultado viejo no se guarda.
+    """
+
+    def __init__(self, ttl_s: float = AVAILABILITY_CACHE_TTL_S):
+        self.ttl_s = ttl_s
+        self._data: Dict[str, Dict[int, _MesCacheado]] = {}
+        self._gen: Dict[str, int] = {}
+        self._gen_all = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def generation(self, month: str) -> Tuple[int, int]:
+        with self._lock:
+            return (self._gen_all, self._gen.get(month, 0))
+
+    def get(self, month: str, today: str, k: int = 1) -> Optional[_MesCacheado]:
+        e = self._data.get(month, {}).get(k)
+        if e and e.today == today and time.monotonic() < e.valid_until:
+            self.hits += 1
+            return e
+        self.misses += 1
+        return None
+
+    def put(
+        self, month: str, today: str, days: Dict[str, list], body: bytes, gen: Tuple[int, int],
+        vence_en_s: Optional[float] = None, k: int = 1,
+    ) -> _MesCacheado:
+        """
+        vence_en_s: el contenido cambia solo en ese plazo (ej. vence un hold).
+        k: slots que necesita el trabajo (cada duración pedida es una variante del mes).
+        """
+        ttl = self.ttl_s if vence_en_s is None else max(0.0, min(self.ttl_s, vence_en_s))
+        e = _MesCacheado(days, body, today, ttl)
+        with self._lock:
+            if gen == (self._gen_all, self._gen.get(month, 0)):
+                self._data.setdefault(month, {})[k] = e
+        return e
+
+    def invalidate(self, months: Iterable[str]) -> None:
+        with self._lock:
+            for m in months:
+                self._gen[m] = self._gen.get(m, 0) + 1
+                self._data.pop(m, None)
+                self.invalidations += 1
+
+    def invalidate_all(self) -> None:
+        with self._lock:
+            self._gen_all += 1
+            self._data.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "months_cached": len(self._data),
+            "ttl_s": self.ttl_s,
+        }
+
+
+availability_cache = AvailabilityCache()
+
+
+def _mes(date_str: Optional[str]) -> Optional[str]:
+    return date_str[:7] if date_str and len(date_str) >= 7 else None
+
+
+# Otros interesados en los cambios de agenda ya commiteados: fn(fechas: set, todo: bool)
+_oyentes_cambios: List[Callable[[Set[str], bool], None]] = []
+
+
+def on_cambios_agenda(fn: Callable[[Set[str], bool], None]) -> Callable[[Set[str], bool], None]:
+    _oyentes_cambios.append(fn)
+    return fn
+
+
+@event.listens_for(Session, "after_flush")
+def _registrar_cambios_agenda(session, flush_context):
+    """Anota en la Session qué fechas de la agenda cambió este flush (se aplica al commit)."""
+    fechas = None
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, (dbBlockRule, dbGlobalConfig)):
+            session.info["agenda_todo"] = True
+        elif isinstance(obj, (dbBooking, dbAvailabilityOverride, dbSlotHold)):
+            if fechas is None:
+                fechas = session.info.setdefault("agenda_fechas", set())
+            fechas.add(obj.date)
+            # Si se movió de fecha, también la fecha anterior
+            for viejo in inspect(obj).attrs.date.history.deleted or ():
+                fechas.add(viejo)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidar_agenda(session):
+    todo = session.info.pop("agenda_todo", False)
+    fechas = {f for f in session.info.pop("agenda_fechas", ()) if f}
+    if todo:
+        # El índice de reglas se recompila en el próximo get (con lo ya commiteado)
+        BlockRuleIndex.invalidate()
+        availability_cache.invalidate_all()
+    elif fechas:
+        availability_cache.invalidate({_mes(f) for f in fechas})
+    else:
+        return
+    for fn in _oyentes_cambios:
+        try:
+            fn(fechas, todo)
+        except Exception as e:
+            print(f"[agenda] Error notificando cambios: {e}")
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _descartar_cambios_agenda(session, previous_transaction):
+    session.info.pop("agenda_todo", None)
+    session.info.pop("agenda_fechas", None)
@@ -4,27 +4,31 @@
 # 🚛 FLETES JAVIER – BACKEND COMPLETO
 # ===================================
 
-from datetime import datetime, timezone, timedelta
+from datetime import date, datetime, timezone, timedelta
 from math import radians, sin, cos, asin, sqrt
 import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 import calendar  # ✅ AÑADIDO (para mes/año)
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 
 # SEGURIDAD
 from .security.security_bootstrap import harden_app
 from .security.auth_dep import require_api_key
 from .security.rate_limit import install_rate_limit, limiter
+from slowapi.util import get_remote_address
 from .security.security_auth import hash_password, verify_password, check_lock, register_fail, reset_fail
 
-import requests
 from fastapi import FastAPI, HTTPException, Depends, Body, BackgroundTasks, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from sqlmodel import Session, select, SQLModel
-from .database import engine, get_session, init_db
+from sqlalchemy import and_, delete, func, or_, update
+from sqlalchemy.exc import IntegrityError
+from .database import engine, get_session, init_db, lock_dia
 from .models.models import (
     dbUser, dbQuote, dbBooking, dbAvailabilityOverride, 
-    dbBlockRule, dbGlobalConfig, dbPricingConfig
+    dbBlockRule, dbGlobalConfig, dbPricingConfig, dbSlotHold
 )
 from dotenv import load_dotenv
 load_dotenv(override=True)
@@ -32,12 +36,27 @@ load_dotenv(override=True)
 # FRONTEND
 from pathlib import Path
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, RedirectResponse
+from fastapi.responses import FileResponse, RedirectResponse, Response, StreamingResponse
 
 # Notificaciones (tu módulo existente)
 from .notifications import send_whatsapp_to_javier, send_email_to_admin
 
 from urllib.parse import quote_plus
+import base64
+import hashlib
+import json
+import secrets
+import numpy as np
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+
+try:
+    import orjson  # encoder rápido para los listados grandes del admin
+
+    def _json_bytes(obj) -> bytes:
+        return orjson.dumps(obj)
+except ImportError:  # sin orjson: mismo JSON, más lento
+    def _json_bytes(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
 
 
 
@@ -113,6 +132,11 @@ if ALLOWED_ORIGINS:
 def on_startup():
     SQLModel.metadata.create_all(engine) # Asegura que audit_logs y nuevas columnas existan
     init_db()
+    scheduler.start()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    scheduler.stop()
 
 def _add_audit_log(session: Session, qid: Optional[int], action: str, details: str):
     try:
@@ -126,12 +150,6 @@ def _add_audit_log(session: Session, qid: Optional[int], action: str, details: s
 # ✅ Colecciones (ahora son tablas, se manejan vía Session)
 # quotes, users, availability, bookings, block_rules, block_config
 
-DEFAULT_SLOTS = [
-    "08:00", "09:00", "10:00", "11:00", "12:00",
-    "13:00", "14:00", "15:00", "16:00", "17:00",
-    "18:00", "19:00", "20:00", "21:00", "22:00"
-]
-
 # ✅ índices útiles
 # Legacy MongoDB index creation removed
 
@@ -141,6 +159,12 @@ DEFAULT_SLOTS = [
 # Config de cálculo (.env)
 # =========================
 ROUTING_PROVIDER = (os.getenv("ROUTING_PROVIDER") or "google").lower()  # google | ors
+# Modo batch (opt-in): los 3 tramos del presupuesto en UNA llamada a Distance Matrix (solo google).
+# Ojo: Google factura por elemento (3x3 = 9 elementos por presupuesto vs 3 por tramo suelto):
+# ahorra latencia, pero triplica el costo de cada presupuesto sin caché.
+ROUTING_BATCH = os.getenv("ROUTING_BATCH", "0") == "1"
+# Log por tramo ruteado (proveedor y resultado, sin direcciones de clientes). Solo para depurar.
+ROUTING_DEBUG = os.getenv("ROUTING_DEBUG", "0") == "1"
 GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
 MAPS_REGION = os.getenv("MAPS_REGION", "AR")
 MAPS_LANGUAGE = os.getenv("MAPS_LANGUAGE", "es")
@@ -149,10 +173,28 @@ ORS_API_KEY = os.getenv("ORS_API_KEY")
 BASE_DIRECCION = os.getenv("BASE_DIRECCION", "Córdoba, Argentina")
 DEFAULT_LOCALITY = os.getenv("DEFAULT_LOCALITY", "Córdoba, Argentina")
 
+# Zona de servicio (lat_min,lng_min,lat_max,lng_max) para validar coordenadas que manda el navegador.
+# Default: provincia de Córdoba con margen.
+SERVICE_AREA_BBOX = tuple(
+    float(x) for x in (os.getenv("SERVICE_AREA_BBOX") or "-35.2,-66.0,-29.3,-61.5").split(",")
+)
+
 # =========================
 # Config de cálculo (Dynamic + .env fallback)
 # =========================
-from .config_manager import DynamicConfig
+from .config_manager import DynamicConfig, ConfigVars, EDITABLE_FIELDS
+from .pricing import costos_desde_conf, costos_batch, filas_costos, columnas_costos, montos_batch, resumen_deltas
+from .maps_cache import geocode_cache, route_cache, quote_preview_cache, cache_key
+from .http_client import http, legs_pool, geo_pool, run_parallel
+from .agenda import (
+    DEFAULT_SLOTS, FULL_MASK, SLOT_MIN, slots_de_mask, mask_de_slots, mask_base_dia,
+    mask_intervalo, slots_necesarios, mask_inicios_bloqueados, inicios_fuera_de_grilla_libres,
+    BlockRuleIndex, touch_block_rules, availability_cache, on_cambios_agenda,
+)
+from .sse import slot_events
+from .scheduler import scheduler
+from .search import condicion_busqueda
+from .export import filas_stream, csv_stream, ndjson_stream, gzip_stream
 
 # Las variables globales se han eliminado para usar DynamicConfig.get_values(db) en tiempo de ejecución.
 # Se mantienen solo las estáticas que no cambian (API Keys, etc).
@@ -187,6 +229,20 @@ class QuoteIn(BaseModel):
     fecha_turno: Optional[str] = None   # YYYY-MM-DD
     hora_turno: Optional[str] = None    # HH:MM
 
+    # ✅ Coordenadas del Autocomplete de Google (opcionales): evitan geocodificar en el server
+    origen_lat: Optional[float] = None
+    origen_lng: Optional[float] = None
+    origen_place_id: Optional[str] = None
+    destino_lat: Optional[float] = None
+    destino_lng: Optional[float] = None
+    destino_place_id: Optional[str] = None
+
+    # ✅ Token devuelto por /api/quote (preview) para que /api/quote/send no recalcule
+    quote_token: Optional[str] = None
+
+    # ✅ Hold de /api/availability/hold sobre (fecha_turno, hora_turno)
+    hold_token: Optional[str] = None
+
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 
@@ -214,6 +270,25 @@ class QuoteUpdate(BaseModel):
     model_config = {"populate_by_name": True, "extra": "allow"}
 
 
+class BatchRowIn(BaseModel):
+    dist_km: float
+    tiempo_viaje_min: int
+    ayudante: bool = False
+    peajes: int = 0
+    viaticos: float = 0.0
+    horas_reales: Optional[float] = None
+
+class QuoteBatchIn(BaseModel):
+    rows: List[BatchRowIn]
+
+class ConfigSimulacionIn(BaseModel):
+    config: Dict[str, Any]                 # ConfigVars candidata (completa o parcial)
+    estados: Optional[List[str]] = None    # None = todos
+    desde: Optional[datetime] = None       # filtra por created_at
+    hasta: Optional[datetime] = None
+    incluir_eliminados: bool = False
+    detalle: bool = True                   # incluir deltas por presupuesto
+
 class ConfirmPayload(BaseModel):
     fecha_hora_preferida: Optional[str] = None
     notas: Optional[str] = None
@@ -234,6 +309,18 @@ class AvailabilityDayIn(BaseModel):
     enabled: bool = True
     slots: List[str] = []
 
+class AvailabilityBulkIn(BaseModel):
+    """
+    Carga masiva de overrides: rango + días de semana con los mismos slots,
+    y/o una lista de días sueltos (mandan sobre el rango si se repite la fecha).
+    """
+    date_from: Optional[str] = None   # YYYY-MM-DD
+    date_to: Optional[str] = None     # YYYY-MM-DD (inclusive)
+    weekdays: List[int] = []          # 0=lunes ... 6=domingo; vacío = todos
+    enabled: bool = True
+    slots: List[str] = []
+    days: List[AvailabilityDayIn] = []
+
 class BlockRuleIn(BaseModel):
     """Regla de bloqueo persistente almacenada en block_rules."""
     hour_from: str
@@ -248,6 +335,12 @@ class ChangeCredsIn(BaseModel):
     new_password: str
 
 # (lo dejamos por compat si después lo querés usar)
+class SlotHoldIn(BaseModel):
+    date: str                            # YYYY-MM-DD
+    time: str                            # HH:MM (inicio)
+    duration_min: Optional[int] = Field(default=None, ge=1, le=24 * 60)  # tiempo_servicio_min del presupuesto
+    replace_token: Optional[str] = None  # hold anterior del mismo cliente (se libera)
+
 class ReserveIn(BaseModel):
     date: str  # YYYY-MM-DD
     slot: str  # "09:30"
@@ -284,17 +377,42 @@ def _normalize_addr(s: str) -> str:
         return f"{s}, {DEFAULT_LOCALITY}"
     return s
 
+def _en_zona_servicio(lat: Optional[float], lng: Optional[float]) -> bool:
+    if lat is None or lng is None:
+        return False
+    lat_min, lng_min, lat_max, lng_max = SERVICE_AREA_BBOX
+    return lat_min <= lat <= lat_max and lng_min <= lng <= lng_max
+
+def _punto_ruteo(addr_norm: str, lat: Optional[float], lng: Optional[float], place_id: Optional[str]) -> tuple:
+    """
+    Punto a usar en el ruteo: coordenadas del cliente (si caen en la zona de servicio),
+    si no el place_id, si no la dirección normalizada. Devuelve (punto, coords | None).
+    """
+    if _en_zona_servicio(lat, lng):
+        return f"{lat:.6f},{lng:.6f}", {"lat": float(lat), "lng": float(lng)}
+    pid = (place_id or "").strip()
+    if pid and pid.replace("-", "").replace("_", "").isalnum() and len(pid) <= 512:
+        return f"place_id:{pid}", None
+    return addr_norm, None
+
 def _geocode_google(address: str) -> Optional[Dict[str, float]]:
     if not GOOGLE_MAPS_API_KEY:
         return None
+    # ✅ Caché (LRU + SQL) por dirección normalizada: las repetidas no llaman a Maps
+    addr_norm = _normalize_addr(address)
+    cached = geocode_cache.get(addr_norm)
+    if cached:
+        return cached
     try:
         url = "https://maps.googleapis.com/maps/api/geocode/json"
-        params = {"address": address, "key": GOOGLE_MAPS_API_KEY, "language": MAPS_LANGUAGE, "region": MAPS_REGION}
-        js = requests.get(url, params=params, timeout=12).json()
+        params = {"address": addr_norm, "key": GOOGLE_MAPS_API_KEY, "language": MAPS_LANGUAGE, "region": MAPS_REGION}
+        js = http.get(url, params=params, timeout=12).json()
         if js.get("status") != "OK":
             return None
         loc = js["results"][0]["geometry"]["location"]
-        return {"lat": loc["lat"], "lng": loc["lng"]}
+        res = {"lat": loc["lat"], "lng": loc["lng"]}
+        geocode_cache.put(addr_norm, res)
+        return res
     except Exception:
         return None
 
@@ -307,45 +425,133 @@ def _distance_time_google(origen: str, destino: str) -> Optional[Dict[str, Any]]
             "origins": origen, "destinations": destino, "key": GOOGLE_MAPS_API_KEY,
             "language": MAPS_LANGUAGE, "region": MAPS_REGION
         }
-        js = requests.get(url, params=params, timeout=12).json()
+        js = http.get(url, params=params, timeout=12).json()
         if js.get("status") != "OK":
             return None
         rows = js.get("rows", [])
         if not rows or not rows[0].get("elements"):
             return None
-        el = rows[0]["elements"][0]
-        if el.get("status") != "OK":
+        return _parse_dm_element(rows[0]["elements"][0])
+    except Exception:
+        return None
+
+def _parse_dm_element(el: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if el.get("status") != "OK":
+        return None
+    dist_m = el["distance"]["value"]
+    dur_s = el["duration"]["value"]
+    return {"dist_km": dist_m/1000.0, "tiempo_viaje_min": int(round(dur_s/60))}
+
+def _distance_matrix_google(origenes: List[str], destinos: List[str]) -> Optional[List[List[Optional[Dict[str, Any]]]]]:
+    """
+    Una sola request a Distance Matrix con varios orígenes/destinos.
+    Devuelve la matriz [i][j] (None en los elementos que fallaron) o None si falló toda la llamada.
+    """
+    if not GOOGLE_MAPS_API_KEY:
+        return None
+    try:
+        url = "https://maps.googleapis.com/maps/api/distancematrix/json"
+        params = {
+            "origins": "|".join(o.replace("|", " ") for o in origenes),
+            "destinations": "|".join(d.replace("|", " ") for d in destinos),
+            "key": GOOGLE_MAPS_API_KEY,
+            "language": MAPS_LANGUAGE, "region": MAPS_REGION
+        }
+        js = http.get(url, params=params, timeout=12).json()
+        if js.get("status") != "OK":
+            return None
+        rows = js.get("rows", [])
+        if len(rows) != len(origenes):
             return None
-        dist_m = el["distance"]["value"]
-        dur_s = el["duration"]["value"]
-        return {"dist_km": dist_m/1000.0, "tiempo_viaje_min": int(round(dur_s/60))}
+        matriz = []
+        for row in rows:
+            els = row.get("elements") or []
+            if len(els) != len(destinos):
+                return None
+            matriz.append([_parse_dm_element(el) for el in els])
+        return matriz
     except Exception:
         return None
 
-def _distance_time_ors(origen: str, destino: str) -> Optional[Dict[str, Any]]:
+def _geocode_ors(address: str) -> Optional[Dict[str, float]]:
     if not ORS_API_KEY:
         return None
     try:
         g_url = "https://api.openrouteservice.org/geocode/search"
         hdr = {"Authorization": ORS_API_KEY}
-        g1 = requests.get(g_url, headers=hdr, params={"text": origen, "size": 1}, timeout=12).json()
-        g2 = requests.get(g_url, headers=hdr, params={"text": destino, "size": 1}, timeout=12).json()
+        g = http.get(g_url, headers=hdr, params={"text": address, "size": 1}, timeout=12).json()
+        feats = g.get("features") or []
+        if not feats:
+            return None
+        lon, lat = feats[0]["geometry"]["coordinates"]
+        return {"lat": lat, "lng": lon}
+    except Exception:
+        return None
 
-        def pick(g):
-            feats = g.get("features") or []
-            if not feats:
-                return None
-            lon, lat = feats[0]["geometry"]["coordinates"]
-            return lat, lon
+class GeoContext:
+    """
+    Contexto de resolución de UN presupuesto: cada dirección distinta se geocodifica
+    como mucho una vez (Google y, si falla, ORS) y la comparten el ruteo ORS, el
+    fallback haversine y las coordenadas que se persisten.
+    Thread-safe: los tramos que corren en paralelo esperan el mismo future.
+    """
 
-        o = pick(g1); d = pick(g2)
+    def __init__(self):
+        self._futures: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _resolver(addr: str) -> Optional[Dict[str, float]]:
+        return _geocode_google(addr) or _geocode_ors(addr)
+
+    def _future(self, addr: str):
+        addr_norm = _normalize_addr(addr)
+        key = cache_key(addr_norm)
+        with self._lock:
+            fut = self._futures.get(key)
+            if fut is None:
+                fut = geo_pool.submit(self._resolver, addr_norm)
+                self._futures[key] = fut
+        return fut
+
+    def seed(self, addr: str, coords: Dict[str, float]) -> None:
+        """Registra coordenadas ya conocidas (p.ej. del Autocomplete) sin geocodificar."""
+        fut: Future = Future()
+        fut.set_result(coords)
+        with self._lock:
+            self._futures[cache_key(_normalize_addr(addr))] = fut
+
+    def alias(self, addr: str, target: str) -> None:
+        """Hace que `addr` (p.ej. "place_id:...") comparta la geocodificación de `target`."""
+        fut = self._future(target)
+        with self._lock:
+            self._futures[cache_key(_normalize_addr(addr))] = fut
+
+    def prefetch(self, *addrs: str) -> None:
+        for a in addrs:
+            self._future(a)
+
+    def get(self, addr: str) -> Optional[Dict[str, float]]:
+        return self._future(addr).result()
+
+    def get_many(self, *addrs: str) -> List[Optional[Dict[str, float]]]:
+        futs = [self._future(a) for a in addrs]
+        return [f.result() for f in futs]
+
+def _distance_time_ors(origen: str, destino: str, geo: Optional[GeoContext] = None) -> Optional[Dict[str, Any]]:
+    if not ORS_API_KEY:
+        return None
+    try:
+        hdr = {"Authorization": ORS_API_KEY}
+        # Los dos geocodes salen del contexto del presupuesto (en paralelo, sin repetir)
+        o, d = (geo or GeoContext()).get_many(origen, destino)
         if not o or not d:
             return None
 
         r_url = "https://api.openrouteservice.org/v2/directions/driving-car"
-        js = requests.get(
+        js = http.get(
             r_url, headers=hdr,
-            params={"start": f"{o[1]},{o[0]}", "end": f"{d[1]},{d[0]}"},
+            params={"start": f"{o['lng']},{o['lat']}", "end": f"{d['lng']},{d['lat']}"},
             timeout=12
         ).json()
         feat = (js.get("features") or [None])[0]
@@ -356,14 +562,13 @@ def _distance_time_ors(origen: str, destino: str) -> Optional[Dict[str, Any]]:
     except Exception:
         return None
 
-def _distance_time_fallback(session: Session, origen: str, destino: str) -> Dict[str, Any]:
+def _distance_time_fallback(session: Session, origen: str, destino: str, geo: Optional[GeoContext] = None) -> Dict[str, Any]:
     # Obtener config actual
     conf = DynamicConfig.get_values(session)
     FACTOR_TRAZADO = conf["FACTOR_TRAZADO"]
     VEL_KMH = conf["VEL_KMH"]
 
-    o = _geocode_google(origen) if GOOGLE_MAPS_API_KEY else None
-    d = _geocode_google(destino) if GOOGLE_MAPS_API_KEY else None
+    o, d = (geo or GeoContext()).get_many(origen, destino)
     if o and d:
         dist_km = _haversine_km(o["lat"], o["lng"], d["lat"], d["lng"]) * FACTOR_TRAZADO
     else:
@@ -381,79 +586,204 @@ def _get_blocked_slots_for_date(session: Session, date_str: str) -> set:
     Devuelve el conjunto de horarios bloqueados por las reglas activas para una fecha dada.
     Si blocks_enabled es False, devuelve set vacío (sin bloqueos).
     """
-    statement_cfg = select(dbGlobalConfig).where(dbGlobalConfig.id == "global_config")
-    cfg = session.exec(statement_cfg).first()
-    
-    if cfg and not cfg.blocks_enabled:
-        return set()
+    reglas = BlockRuleIndex.get(session)
+    return set(slots_de_mask(reglas.mask_dia(date_str, _today_ar_str())))
 
-    today_str = _today_ar_str()
-    blocked = set()
-    
-    statement_rules = select(dbBlockRule)
-    rules = session.exec(statement_rules).all()
+def _validar_turno(session: Session, fecha: str, hora: str) -> Optional[dbAvailabilityOverride]:
+    """
+    Valida que (fecha, hora) se pueda reservar: no pasado, día habilitado y horario ofrecido
+    (override del admin o DEFAULT_SLOTS). Devuelve el override del día (si hay).
+    """
+    hoy_ar = datetime.now(AR_TZ)
+    try:
+        req_dt = datetime.strptime(f"{fecha} {hora}", "%Y-%m-%d %H:%M").replace(tzinfo=AR_TZ)
+        if req_dt < hoy_ar - timedelta(minutes=5):
+            raise HTTPException(status_code=409, detail="Ese horario ya pasó")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de fecha/hora inválido")
+
+    statement_ovr = select(dbAvailabilityOverride).where(dbAvailabilityOverride.date == fecha)
+    day_ovr = session.exec(statement_ovr).first()
     
-    for rule in rules:
-        hf  = rule.hour_from
-        ht  = rule.hour_to
-        if not hf or not ht:
-            continue
-        if rule.apply_all:
-            # Aplica a todos los días desde hoy
-            if date_str < today_str:
-                continue
-        else:
-            df = rule.date_from
-            dt = rule.date_to
-            if not df or not dt or not (df <= date_str <= dt):
-                continue
-        for slot in DEFAULT_SLOTS:
-            if hf <= slot <= ht:
-                blocked.add(slot)
-    return blocked
+    if day_ovr:
+        if not day_ovr.enabled:
+            raise HTTPException(status_code=409, detail="El día seleccionado no está habilitado")
+        if day_ovr.slots and hora not in day_ovr.slots:
+            raise HTTPException(status_code=409, detail="El horario ya no está disponible")
+    else:
+        if hora not in DEFAULT_SLOTS:
+            raise HTTPException(status_code=409, detail="Horario no válido para este servicio")
+    return day_ovr
+
+# Holds: un cliente "aparta" (fecha, hora) unos minutos mientras completa el formulario
+SLOT_HOLD_MINUTES = int(os.getenv("SLOT_HOLD_MINUTES", "10"))
+# Holds vigentes por cliente (IP): sin tope, una IP podría apartar medio calendario
+SLOT_HOLD_MAX_POR_CLIENTE = int(os.getenv("SLOT_HOLD_MAX_POR_CLIENTE", "2"))
+
+def _hold_vigente(session: Session, token: Optional[str], fecha: Optional[str], hora: Optional[str]) -> Optional[dbSlotHold]:
+    """El hold del token si sigue vigente y es de ese mismo horario."""
+    if not token:
+        return None
+    hold = session.exec(select(dbSlotHold).where(dbSlotHold.token == token)).first()
+    if not hold or hold.date != fecha or hold.time != hora:
+        return None
+    vence = hold.expires_at
+    if vence.tzinfo is None:  # SQLite devuelve naive (guardado en UTC)
+        vence = vence.replace(tzinfo=timezone.utc)
+    return hold if vence > datetime.now(timezone.utc) else None
+
+def _hold_ajeno(session: Session, fecha: str, hora: str, duration_min: int = SLOT_MIN,
+                excluir_token: Optional[str] = None) -> bool:
+    """Hay un hold vigente de otro cliente que se superpone con [hora, hora + duration_min)."""
+    statement = select(dbSlotHold.time, dbSlotHold.duration_min).where(
+        dbSlotHold.date == fecha,
+        dbSlotHold.expires_at > datetime.now(timezone.utc)
+    )
+    if excluir_token:
+        statement = statement.where(dbSlotHold.token != excluir_token)
+    pedido = mask_intervalo(hora, duration_min)
+    return any(mask_intervalo(t, d) & pedido for t, d in session.exec(statement).all())
+
+def _booking_superpuesto(session: Session, fecha: str, hora: str, duration_min: int = SLOT_MIN) -> bool:
+    """Hay un booking activo cuyo intervalo se superpone con [hora, hora + duration_min)."""
+    statement = select(dbBooking.time, dbBooking.duration_min).where(
+        dbBooking.date == fecha,
+        dbBooking.status.in_(["reserved", "confirmed"])
+    )
+    pedido = mask_intervalo(hora, duration_min)
+    return any(mask_intervalo(t, d) & pedido for t, d in session.exec(statement).all() if t)
+
+def _ocupado_por_fecha(session: Session, fechas: List[str]) -> Dict[str, int]:
+    """Máscara de los slots que ocupan los bookings activos de cada fecha (intervalo completo)."""
+    statement = select(dbBooking.date, dbBooking.time, dbBooking.duration_min).where(
+        dbBooking.date >= min(fechas),
+        dbBooking.date <= max(fechas),
+        dbBooking.status.in_(["reserved", "confirmed"])
+    )
+    pedidas = set(fechas)
+    ocupado: Dict[str, int] = {}
+    for b_date, b_time, b_dur in session.exec(statement).all():
+        if b_date in pedidas and b_time:
+            ocupado[b_date] = ocupado.get(b_date, 0) | mask_intervalo(b_time, b_dur)
+    return ocupado
+
+def _slots_con_reservas(enabled: bool, slots: List[str], ocupado: int) -> List[str]:
+    """
+    Slots a guardar en el override: los pedidos más los que ocupa un trabajo reservado.
+    Lista vacía (grilla completa) y día deshabilitado se guardan tal cual.
+    """
+    if not enabled or not slots or not ocupado:
+        return list(slots)
+    return list(slots_de_mask(mask_de_slots(slots) | ocupado))
 
 # _purge_expired_unconfirmed ELIMINADO permanentemente para evitar pérdida de datos.
 
 
 
-def _marcar_realizados(session: Session):
+def _marcar_realizados(session: Session) -> int:
+    """Confirmado + fecha_turno válida pasada => Realizado. Un solo UPDATE por conjunto."""
     hoy = _today_ar_str()
-
-    # Confirmado + fecha_turno válida pasada => Realizado
-    statement = select(dbQuote).where(
-        dbQuote.estado == "confirmado",
-        dbQuote.fecha_turno < hoy,
-        dbQuote.fecha_turno != "",
-        dbQuote.fecha_turno != "1970-01-01",
-        dbQuote.fecha_turno.is_not(None)
+    res = session.execute(
+        update(dbQuote)
+        .where(
+            dbQuote.estado == "confirmado",
+            dbQuote.fecha_turno < hoy,
+            dbQuote.fecha_turno != "",
+            dbQuote.fecha_turno != "1970-01-01",
+            dbQuote.fecha_turno.is_not(None)
+        )
+        .values(estado="realizado")
+        .execution_options(synchronize_session=False)
     )
-    quotes_to_update = session.exec(statement).all()
-    
-    for q in quotes_to_update:
-        q.estado = "realizado"
-        # Nota: en SQLModel no tenemos realizado_en en el modelo dbQuote, 
-        # pero podemos agregarlo o ignorarlo por ahora si no es crítico.
-        # Mantendremos la consistencia con el modelo definido.
-        # q.realizado_en = datetime.now(timezone.utc)
-    
-    if quotes_to_update:
-        session.commit()
-
+    session.commit()
+    return res.rowcount or 0
 
-def calcular_ruta(session: Session, origen: str, destino: str) -> Dict[str, Any]:
-    used = None
-    res = None
+# =========================
+# Tareas periódicas (fuera del camino de lectura)
+# =========================
+REALIZADOS_INTERVAL_S = float(os.getenv("REALIZADOS_INTERVAL_S", "300"))
+HOLDS_PURGE_INTERVAL_S = float(os.getenv("HOLDS_PURGE_INTERVAL_S", "600"))
+
+@scheduler.every(REALIZADOS_INTERVAL_S, name="marcar_realizados")
+def _job_marcar_realizados() -> int:
+    with Session(engine) as s:
+        return _marcar_realizados(s)
+
+@scheduler.every(HOLDS_PURGE_INTERVAL_S, name="purgar_holds")
+def _job_purgar_holds() -> int:
+    # Los vencidos ya no cuentan para la agenda; esto solo achica la tabla
+    with Session(engine) as s:
+        res = s.execute(delete(dbSlotHold).where(dbSlotHold.expires_at <= datetime.now(timezone.utc)))
+        s.commit()
+        return res.rowcount or 0
+
+
+def calcular_ruta(session: Session, origen: str, destino: str, geo: Optional[GeoContext] = None) -> Dict[str, Any]:
+    # ✅ Caché de tramos (LRU + SQL): preview, envío y edición del mismo recorrido no llaman a la API
+    cached = route_cache.get(ROUTING_PROVIDER, origen, destino)
+    if cached:
+        return cached
+    return _calcular_ruta_proveedores(session, origen, destino, geo=geo or GeoContext())
+
+def _ruta_api(origen: str, destino: str, geo: GeoContext) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Cadena de proveedores externos. No toca la DB, así que puede correr en legs_pool."""
     if ROUTING_PROVIDER == "google":
-        res = _distance_time_google(origen, destino); used = "google"
-        if not res and ORS_API_KEY:
-            res = _distance_time_ors(origen, destino); used = "ors(fallback)"
+        res = _distance_time_google(origen, destino)
+        if res:
+            return res, "google"
+        if ORS_API_KEY:
+            res = _distance_time_ors(origen, destino, geo)
+            if res:
+                return res, "ors"
     else:
-        res = _distance_time_ors(origen, destino); used = "ors"
-        if not res and GOOGLE_MAPS_API_KEY:
-            res = _distance_time_google(origen, destino); used = "google(fallback)"
+        res = _distance_time_ors(origen, destino, geo)
+        if res:
+            return res, "ors"
+        if GOOGLE_MAPS_API_KEY:
+            res = _distance_time_google(origen, destino)
+            if res:
+                return res, "google"
+    return None, None
+
+def _calcular_ruta_proveedores(session: Session, origen: str, destino: str, api_res=None, geo: Optional[GeoContext] = None) -> Dict[str, Any]:
+    geo = geo or GeoContext()
+    res, used = api_res if api_res is not None else _ruta_api(origen, destino, geo)
     if not res:
-        res = _distance_time_fallback(session, origen, destino); used = "fallback(heuristica_10km)"
-    print(f"[route] provider_used={used} origen='{origen}' destino='{destino}' -> {res}")
+        res = _distance_time_fallback(session, origen, destino, geo); used = "fallback"
+    if ROUTING_DEBUG:
+        print(f"[route] provider_used={used} -> {res}")
+    route_cache.put(ROUTING_PROVIDER, origen, destino, res, used)
+    res["provider_used"] = used
+    return res
+
+def calcular_tramos(session: Session, base: str, origen: str, destino: str, geo: Optional[GeoContext] = None) -> List[Dict[str, Any]]:
+    """
+    Resuelve los tramos base→origen, origen→destino y destino→base.
+    Con ROUTING_BATCH (google) los tramos que no están en caché salen de una única
+    llamada a Distance Matrix (diagonal de la matriz); lo que falle cae a calcular_ruta.
+    """
+    geo = geo or GeoContext()
+    legs = [(base, origen), (origen, destino), (destino, base)]
+    res: List[Optional[Dict[str, Any]]] = [route_cache.get(ROUTING_PROVIDER, o, d) for o, d in legs]
+    faltan = [i for i, r in enumerate(res) if not r]
+
+    if len(faltan) > 1 and ROUTING_BATCH and ROUTING_PROVIDER == "google" and GOOGLE_MAPS_API_KEY:
+        matriz = _distance_matrix_google([legs[i][0] for i in faltan], [legs[i][1] for i in faltan])
+        if matriz:
+            for k, i in enumerate(faltan):
+                el = matriz[k][k]
+                if el:
+                    route_cache.put(ROUTING_PROVIDER, legs[i][0], legs[i][1], el, "google")
+                    res[i] = {**el, "provider_used": "google"}
+            if ROUTING_DEBUG:
+                print(f"[route] batch provider_used=google tramos={faltan} -> {[res[i] for i in faltan]}")
+
+    # Tramos restantes: las APIs en paralelo (la latencia es la del tramo más lento);
+    # el fallback usa la session, así que se resuelve en este thread
+    pendientes = [i for i, r in enumerate(res) if not r]
+    apis = run_parallel(legs_pool, [lambda o=legs[i][0], d=legs[i][1]: _ruta_api(o, d, geo) for i in pendientes])
+    for i, api_res in zip(pendientes, apis):
+        res[i] = _calcular_ruta_proveedores(session, legs[i][0], legs[i][1], api_res, geo)
     return res
 
 # =========================
@@ -475,91 +805,11 @@ def calcular_costos(
 
     # 1) Obtener configuración dinámica
     conf = DynamicConfig.get_values(session)
-    
-    FACTOR_PONDERACION = conf.get("FACTOR_PONDERACION", 1.5)
-    COSTO_HORA = conf.get("COSTO_HORA", 0.0)
-    COSTO_HORA_AYUDANTE = conf.get("COSTO_HORA_AYUDANTE", 0.0)
-    COSTO_CHOFER_HORA = conf.get("COSTO_CHOFER_HORA", 0.0)
-    COSTO_ADMIN_HORA = conf.get("COSTO_ADMIN_HORA", 0.0)
-    KM_POR_LITRO = max(conf.get("KM_POR_LITRO", 8.0), 0.1)
-    COSTO_LITRO = conf.get("COSTO_LITRO", 0.0)
-    MANTENIMIENTO_PCT = conf.get("MANTENIMIENTO_PCT", 0.0)
-    COSTO_PEAJE = conf.get("COSTO_PEAJE", 0.0)
-    CARGA_DESC_H = conf.get("CARGA_DESC_H", 0.0)
-    BASE_FIJA = conf.get("BASE_FIJA", 0.0)
-    MIN_TOTAL = conf.get("MIN_TOTAL", 0.0)
-    REDONDEO_MIN = conf.get("REDONDEO_MIN", 0)
-    
-    # Flags de comportamiento
-    INCLUIR_CHOFER_ADMIN = conf.get("INCLUIR_CHOFER_ADMIN_EN_TOTAL", False)
-
-    # 2) Tiempo de viaje base (manejo)
-    # Si el tiempo es 0 o muy bajo, puede haber un error de API o velocidad 0
-    horas_manejo = (horas_reales if (horas_reales and horas_reales > 0) else (tiempo_viaje_min / 60.0))
-    if horas_manejo < 0.01 and dist_km > 0:
-        # Fallback de velocidad si algo falló (35km/h)
-        horas_manejo = dist_km / 35.0
-
-    # 3) Tiempo Total (Según Excel: (Manejo_Total * Ponderación) + Carga/Descarga)
-    # Ya no sumamos extra_servicio_min por fuera para evitar duplicación
-    tiempo_total_h = (horas_manejo * FACTOR_PONDERACION) + CARGA_DESC_H
-
-    # 4) Redondeo opcional
-    if REDONDEO_MIN > 0:
-        import math
-        bloque_h = REDONDEO_MIN / 60.0
-        tiempo_total_h = bloque_h * math.ceil(tiempo_total_h / bloque_h)
-
-    # 5) Cálculos de costos basados en TIEMPO
-    costo_tiempo_base = tiempo_total_h * COSTO_HORA
-    
-    # Mantenimiento como % del costo de tiempo (Javier Excel: 20%)
-    pct_dec = MANTENIMIENTO_PCT / 100.0 if MANTENIMIENTO_PCT >= 1 else MANTENIMIENTO_PCT
-    mantenimiento = costo_tiempo_base * pct_dec
-    
-    # Ayudante (solo si el cliente lo pide)
-    costo_ayudante = (tiempo_total_h * COSTO_HORA_AYUDANTE) if ayudante else 0.0
-    
-    # Costos parciales internos (informativos)
-    costo_chofer = tiempo_total_h * COSTO_CHOFER_HORA
-    costo_admin = tiempo_total_h * COSTO_ADMIN_HORA
-
-    # 6) Cálculos de costos basados en DISTANCIA
-    costo_combustible = (dist_km / KM_POR_LITRO) * COSTO_LITRO
-    costo_peajes = peajes * COSTO_PEAJE
-    
-    costo_distancia_total = costo_combustible + costo_peajes + viaticos
-
-    # 7) MONTO TOTAL ESTIMADO
-    # Suma exacta de Javier: Costo Tiempo + Mantenimiento + Ayudante + Costo Distancia
-    monto_estimado = (
-        BASE_FIJA
-        + costo_tiempo_base
-        + mantenimiento
-        + costo_ayudante
-        + costo_distancia_total
+    return costos_desde_conf(
+        conf, dist_km, tiempo_viaje_min, ayudante,
+        horas_reales=horas_reales, peajes=peajes, viaticos=viaticos,
+        extra_servicio_min=extra_servicio_min,
     )
-    
-    # Si el admin activó incluir costos internos en el precio al cliente
-    if INCLUIR_CHOFER_ADMIN:
-        monto_estimado += (costo_chofer + costo_admin)
-
-    monto_estimado = max(monto_estimado, MIN_TOTAL)
-
-    return {
-        "horas_base": round(tiempo_total_h, 2),
-        "tiempo_servicio_min": int(round(tiempo_total_h * 60)),
-        "costo_tiempo_base": round(costo_tiempo_base, 2),
-        "mantenimiento": round(mantenimiento, 2),
-        "costo_tiempo": round(costo_tiempo_base + mantenimiento + costo_ayudante, 2),
-        "costo_combustible": round(costo_combustible, 2),
-        "peajes_total": round(costo_peajes, 2),
-        "viaticos": round(viaticos, 2),
-        "costo_ayudante": round(costo_ayudante, 2),
-        "costo_chofer_parcial": round(costo_chofer, 2),
-        "costo_admin_parcial": round(costo_admin, 2),
-        "monto_estimado": round(monto_estimado, 2),
-    }
 
 # =========================
 # Serializaciones
@@ -821,99 +1071,328 @@ def _notify_confirmed_quote(doc: dict):
 # ✅ AGENDA (Disponibilidad)
 # =========================
 
-@app.get("/api/availability")
-def get_availability(
-    month: str = Query(..., description="YYYY-MM"),
-    session: Session = Depends(get_session)
-):
+AVAILABILITY_MAX_MONTHS = int(os.getenv("AVAILABILITY_MAX_MONTHS", "12"))
+
+def _disponibilidad_rango(
+    session: Session, start: date, end: date, today_str: str, n_slots: int = 1
+) -> Tuple[Dict[str, List[str]], Optional[float]]:
     """
-    Público: devuelve disponibilidad real (Merge de DEFAULT_SLOTS + Disponibilidad Admin + Bookings)
-    { days: { 'YYYY-MM-DD': ['08:00', '09:00', ...] } }
+    Merge de DEFAULT_SLOTS + Disponibilidad Admin + Bookings + Holds + Reglas entre start y end (inclusive).
+    Una consulta por tabla para todo el rango; solo devuelve los días que difieren de DEFAULT_SLOTS.
+    n_slots: slots consecutivos que necesita el trabajo; un inicio se ofrece solo si entra
+    completo antes del próximo booking/hold.
+    También devuelve en cuántos segundos vence el primer hold del rango (None si no hay).
     """
-    try:
-        year, mon = map(int, month.split("-"))
-        last_day = calendar.monthrange(year, mon)[1]
-    except Exception:
-        raise HTTPException(status_code=400, detail="month inválido. Usar YYYY-MM")
-
-    start = f"{year:04d}-{mon:02d}-01"
-    end   = f"{year:04d}-{mon:02d}-{last_day:02d}"
+    start_s, end_s = start.isoformat(), end.isoformat()
 
     # 1) Obtener overrides del admin
     statement_ovr = select(dbAvailabilityOverride).where(
-        dbAvailabilityOverride.date >= start,
-        dbAvailabilityOverride.date <= end
+        dbAvailabilityOverride.date >= start_s,
+        dbAvailabilityOverride.date <= end_s
     )
     overrides = {ovr.date: ovr for ovr in session.exec(statement_ovr).all()}
     
-    # 2) Obtener bookings (reservados o confirmados)
-    statement_booked = select(dbBooking).where(
-        dbBooking.date >= start,
-        dbBooking.date <= end,
+    # 2) Obtener bookings (reservados o confirmados): cada uno ocupa su intervalo
+    statement_booked = select(dbBooking.date, dbBooking.time, dbBooking.duration_min).where(
+        dbBooking.date >= start_s,
+        dbBooking.date <= end_s,
         dbBooking.status.in_(["reserved", "confirmed"])
     )
-    booked = {}
-    for b in session.exec(statement_booked).all():
-        booked.setdefault(b.date, set()).add(b.time)
+    booked: Dict[str, int] = {}
+    for b_date, b_time, b_dur in session.exec(statement_booked).all():
+        if b_time:
+            booked[b_date] = booked.get(b_date, 0) | mask_intervalo(b_time, b_dur)
+
+    # 2b) Holds vigentes: ocupan su intervalo igual que un booking hasta que vencen
+    now = datetime.now(timezone.utc)
+    statement_holds = select(dbSlotHold.date, dbSlotHold.time, dbSlotHold.duration_min, dbSlotHold.expires_at).where(
+        dbSlotHold.date >= start_s,
+        dbSlotHold.date <= end_s,
+        dbSlotHold.expires_at > now
+    )
+    vence_en_s = None
+    for h_date, h_time, h_dur, h_exp in session.exec(statement_holds).all():
+        booked[h_date] = booked.get(h_date, 0) | mask_intervalo(h_time, h_dur)
+        if h_exp.tzinfo is None:
+            h_exp = h_exp.replace(tzinfo=timezone.utc)
+        s_restantes = (h_exp - now).total_seconds()
+        vence_en_s = s_restantes if vence_en_s is None else min(vence_en_s, s_restantes)
 
-    # 3) Obtener configuración global de bloqueos y REGLAS
-    statement_cfg = select(dbGlobalConfig).where(dbGlobalConfig.id == "global_config")
-    cfg = session.exec(statement_cfg).first()
-    is_blocking_active = cfg.blocks_enabled if cfg else True
-    
-    rules_cache = []
-    if is_blocking_active:
-        statement_rules = select(dbBlockRule)
-        rules_cache = session.exec(statement_rules).all()
+    # 3) Reglas de bloqueo ya compiladas (incluye blocks_enabled)
+    reglas = BlockRuleIndex.get(session)
 
-    today_str = _today_ar_str()
     days: Dict[str, List[str]] = {}
     
-    # 4) Construir respuesta iterando días del mes
-    for d in range(1, last_day + 1):
-        date_str = f"{year:04d}-{mon:02d}-{d:02d}"
-        
-        # Base: lo que el admin configuró o el default
-        day_ovr = overrides.get(date_str)
-        if day_ovr and not day_ovr.enabled:
-            days[date_str] = []
-            continue
-            
-        base_slots = day_ovr.slots if (day_ovr and day_ovr.slots) else DEFAULT_SLOTS
-        
-        # Restar bookings
-        day_booked = booked.get(date_str, set())
-        final_slots = [s for s in base_slots if s not in day_booked]
-
-        # Aplicar reglas dinámicas de bloqueo desde el cache (OPTIMIZADO)
-        if is_blocking_active and rules_cache:
-            blocked_by_rules = set()
-            for rule in rules_cache:
-                hf = rule.hour_from
-                ht = rule.hour_to
-                if not hf or not ht: continue
-
-                # Validar si aplica según modo (apply_all o rango)
-                if rule.apply_all:
-                    if date_str < today_str: continue
-                else:
-                    df = rule.date_from
-                    dt = rule.date_to
-                    if not df or not dt or not (df <= date_str <= dt): continue
-                
-                # Agregar slots al set de bloqueados
-                for slot in DEFAULT_SLOTS:
-                    if hf <= slot <= ht:
-                        blocked_by_rules.add(slot)
-            
-            if blocked_by_rules:
-                final_slots = [s for s in final_slots if s not in blocked_by_rules]
+    # 4) Construir respuesta iterando los días (un bit por slot)
+    fechas = [date.fromordinal(o).isoformat() for o in range(start.toordinal(), end.toordinal() + 1)]
+    for date_str, bloqueados in zip(fechas, reglas.masks_rango(fechas, today_str)):
+        # Base (override del admin o default) - inicios que chocan con bookings - reglas de bloqueo
+        base = mask_base_dia(overrides.get(date_str)) & ~bloqueados
+        ocupado = booked.get(date_str, 0)
+        mask = base & ~mask_inicios_bloqueados(ocupado, n_slots)
+        if base > FULL_MASK:
+            # Horarios fuera de grilla en el override: chequeo de intervalo puntual
+            mask = (mask & FULL_MASK) | inicios_fuera_de_grilla_libres(base, ocupado, n_slots * SLOT_MIN)
 
         # Si el resultado es distinto al DEFAULT_SLOTS original, lo enviamos
-        if sorted(final_slots) != sorted(DEFAULT_SLOTS):
-            days[date_str] = final_slots
+        if mask != FULL_MASK:
+            days[date_str] = list(slots_de_mask(mask))
+    return days, vence_en_s
+
+def _parse_mes(value: str) -> Tuple[int, int]:
+    """YYYY-MM (o YYYY-MM-DD, se toma el mes)."""
+    try:
+        year, mon = map(int, value[:7].split("-"))
+        calendar.monthrange(year, mon)
+        return year, mon
+    except Exception:
+        raise HTTPException(status_code=400, detail="month inválido. Usar YYYY-MM")
+
+def _meses_disponibilidad(
+    session: Session, meses: List[Tuple[int, int]], today_str: str, n_slots: int = 1
+) -> list:
+    """
+    Entradas del caché de disponibilidad para cada mes. Los que faltan se calculan
+    juntos en una sola pasada sobre el rango que los cubre y se guardan por mes.
+    """
+    keys = [f"{y:04d}-{m:02d}" for y, m in meses]
+    entries = {mk: availability_cache.get(mk, today_str, n_slots) for mk in keys}
+    faltan = [ym for ym, mk in zip(meses, keys) if entries[mk] is None]
+    if faltan:
+        gens = {f"{y:04d}-{m:02d}": availability_cache.generation(f"{y:04d}-{m:02d}") for y, m in faltan}
+        (y0, m0), (y1, m1) = faltan[0], faltan[-1]
+        days, vence_en_s = _disponibilidad_rango(
+            session, date(y0, m0, 1), date(y1, m1, calendar.monthrange(y1, m1)[1]), today_str, n_slots
+        )
+        por_mes: Dict[str, Dict[str, List[str]]] = {mk: {} for mk in gens}
+        for d, slots in days.items():
+            if d[:7] in por_mes:
+                por_mes[d[:7]][d] = slots
+        for mk, month_days in por_mes.items():
+            body = JSONResponse(content={"ok": True, "month": mk, "days": month_days}).body
+            entries[mk] = availability_cache.put(mk, today_str, month_days, body, gens[mk], vence_en_s, n_slots)
+    return [entries[mk] for mk in keys]
+
+def _etag_compuesto(prefix: str, entries: list) -> str:
+    h = hashlib.blake2b(digest_size=10)
+    h.update(prefix.encode())
+    for e in entries:
+        h.update(e.etag.encode())
+    return '"' + h.hexdigest() + '"'
+
+def _etag_coincide(request: Request, etag: str) -> bool:
+    inm = request.headers.get("if-none-match")
+    return bool(inm) and etag in [t.strip().removeprefix("W/") for t in inm.split(",")]
+
+@app.get("/api/availability")
+def get_availability(
+    request: Request,
+    month: Optional[str] = Query(default=None, description="YYYY-MM"),
+    months: int = Query(default=1, ge=1, description="Cantidad de meses desde month"),
+    desde: Optional[str] = Query(default=None, alias="from", description="YYYY-MM (rango, en lugar de month/months)"),
+    hasta: Optional[str] = Query(default=None, alias="to", description="YYYY-MM"),
+    formato: str = Query(default="json", description="json | ndjson (una línea por mes)"),
+    duration_min: Optional[int] = Query(default=None, ge=1, le=24 * 60, description="Duración del servicio (tiempo_servicio_min del presupuesto)"),
+    session: Session = Depends(get_session)
+):
+    """
+    Público: devuelve disponibilidad real (Merge de DEFAULT_SLOTS + Disponibilidad Admin + Bookings)
+    { days: { 'YYYY-MM-DD': ['08:00', '09:00', ...] } }
+    Cacheado por mes con ETag: una vista repetida responde 304 sin tocar la DB.
+    Rango (month+months o from/to): una sola pasada para todos los meses; formato=ndjson
+    devuelve una línea {"ok","month","days"} por mes.
+    duration_min: solo se ofrecen inicios donde el trabajo entero entra antes del próximo booking.
+    """
+    if formato not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="formato inválido. Usar json | ndjson")
+    if desde or hasta:
+        y0, m0 = _parse_mes(desde or hasta)
+        y1, m1 = _parse_mes(hasta or desde)
+        months = (y1 - y0) * 12 + (m1 - m0) + 1
+        if months < 1:
+            raise HTTPException(status_code=400, detail="from debe ser <= to")
+    elif month:
+        y0, m0 = _parse_mes(month)
+    else:
+        raise HTTPException(status_code=400, detail="Se requiere month o from/to")
+    if months > AVAILABILITY_MAX_MONTHS:
+        raise HTTPException(status_code=400, detail=f"Máximo {AVAILABILITY_MAX_MONTHS} meses por request")
+
+    meses = [divmod((y0 * 12 + m0 - 1) + i, 12) for i in range(months)]
+    meses = [(y, m + 1) for y, m in meses]
+    today_str = _today_ar_str()
+    n_slots = slots_necesarios(duration_min)
+    entries = _meses_disponibilidad(session, meses, today_str, n_slots)
+
+    if months == 1 and formato == "json":
+        entry = entries[0]
+        etag = entry.etag
+    else:
+        etag = _etag_compuesto(f"{formato}|{n_slots}", entries)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_coincide(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    if formato == "ndjson":
+        return StreamingResponse(
+            (e.body + b"\n" for e in entries), media_type="application/x-ndjson", headers=headers
+        )
+    if months == 1:
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+    days: Dict[str, List[str]] = {}
+    for e in entries:
+        days.update(e.days)
+    return JSONResponse(
+        content={
+            "ok": True,
+            "from": f"{meses[0][0]:04d}-{meses[0][1]:02d}",
+            "to": f"{meses[-1][0]:04d}-{meses[-1][1]:02d}",
+            "days": days,
+        },
+        headers=headers,
+    )
+
+# Push de cambios de la agenda (SSE). Se recalculan las fechas tocadas en un thread
+# aparte, después del commit, y solo si hay alguien escuchando.
+_agenda_events_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="agenda-events")
+SSE_MAX_DIAS_DELTA = 62
+
+def _emitir_delta_agenda(fechas: set, todo: bool):
+    if todo:
+        # Reglas / blocks_enabled: cambia todo, el cliente vuelve a pedir sus meses (ETag)
+        slot_events.publish("reload", {})
+        return
+    fechas = sorted(fechas)
+    try:
+        inicio, fin = date.fromisoformat(fechas[0]), date.fromisoformat(fechas[-1])
+    except ValueError:
+        slot_events.publish("reload", {})
+        return
+    if (fin - inicio).days > SSE_MAX_DIAS_DELTA:
+        slot_events.publish("reload", {"months": sorted({f[:7] for f in fechas})})
+        return
+    # Un delta por cada duración que tiene algún calendario abierto (los inicios ofrecidos dependen
+    # de ella); las demás duraciones reciben "reload"
+    datos = {}
+    with Session(engine) as s:
+        for n_slots in sorted(slot_events.slots_escuchados() or {1}):
+            days, _ = _disponibilidad_rango(s, inicio, fin, _today_ar_str(), n_slots)
+            datos[n_slots] = {"days": {f: days.get(f, DEFAULT_SLOTS) for f in fechas}}
+    slot_events.publish_por_slots("slots", datos)
+
+@on_cambios_agenda
+def _encolar_delta_agenda(fechas: set, todo: bool):
+    if not slot_events.clientes():
+        # Nadie escuchando: no se recalcula nada, pero quien reconecte sabrá que debe recargar
+        slot_events.publish("reload", {})
+        return
+    def run():
+        try:
+            _emitir_delta_agenda(fechas, todo)
+        except Exception as e:
+            print(f"[sse] Error armando delta de agenda: {e}")
+    _agenda_events_pool.submit(run)
+
+@app.get("/api/availability/stream")
+async def availability_stream(
+    request: Request,
+    duration_min: Optional[int] = Query(default=None, ge=1, le=24 * 60, description="Igual que en /api/availability"),
+):
+    """
+    Público (SSE): avisa cambios de disponibilidad sin polling.
+    - event: slots  -> {"days": {"YYYY-MM-DD": [slots disponibles]}} (solo las fechas que cambiaron,
+      con los inicios donde entra un trabajo de duration_min)
+    - event: reload -> cambiaron reglas/bloqueos: volver a pedir /api/availability
+    """
+    return StreamingResponse(
+        slot_events.stream(request, request.headers.get("last-event-id"), slots_necesarios(duration_min)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/api/availability/hold")
+@limiter.limit("20/minute")
+def hold_slot(
+    request: Request,
+    body: SlotHoldIn,
+    session: Session = Depends(get_session)
+):
+    """
+    Público: aparta [time, time + duration_min) por SLOT_HOLD_MINUTES mientras el cliente completa
+    el formulario. Devuelve hold_token para mandar en /api/quote/send. replace_token libera el hold anterior.
+    """
+    _validar_turno(session, body.date, body.time)
+    duracion = int(body.duration_min or SLOT_MIN)
 
-    return {"ok": True, "month": month, "days": days}
+    if _booking_superpuesto(session, body.date, body.time, duracion):
+        raise HTTPException(status_code=409, detail="El trabajo no entra antes de la próxima reserva de ese día")
+
+    now = datetime.now(timezone.utc)
+    cliente = get_remote_address(request)
+    statement_activos = select(func.count()).select_from(dbSlotHold).where(
+        dbSlotHold.client == cliente,
+        dbSlotHold.expires_at > now
+    )
+    if body.replace_token:
+        # El hold que se reemplaza no cuenta
+        statement_activos = statement_activos.where(dbSlotHold.token != body.replace_token)
+    if session.exec(statement_activos).one() >= SLOT_HOLD_MAX_POR_CLIENTE:
+        raise HTTPException(
+            status_code=429,
+            detail="Ya tenés horarios apartados: liberá uno (o mandá replace_token) antes de apartar otro",
+        )
+
+    try:
+        # Vencidos fuera (liberan su (date, time) para el índice único) + el hold anterior del cliente
+        session.execute(delete(dbSlotHold).where(dbSlotHold.expires_at <= now))
+        if body.replace_token:
+            previo = session.exec(select(dbSlotHold).where(dbSlotHold.token == body.replace_token)).first()
+            if previo:
+                session.delete(previo)
+                session.flush()  # DELETE antes del INSERT (puede ser el mismo horario)
+        # Mismo candado que el envío: el índice único solo ve el inicio, no el intervalo
+        lock_dia(session, body.date)
+        if _booking_superpuesto(session, body.date, body.time, duracion):
+            session.rollback()
+            raise HTTPException(status_code=409, detail="El trabajo no entra antes de la próxima reserva de ese día")
+        if _hold_ajeno(session, body.date, body.time, duracion, excluir_token=body.replace_token):
+            session.rollback()
+            raise HTTPException(status_code=409, detail="Ese horario está siendo reservado por otra persona")
+        hold = dbSlotHold(
+            date=body.date,
+            time=body.time,
+            duration_min=duracion,
+            token=secrets.token_urlsafe(16),
+            client=cliente,
+            expires_at=now + timedelta(minutes=SLOT_HOLD_MINUTES),
+        )
+        session.add(hold)
+        session.commit()
+    except IntegrityError:
+        session.rollback()
+        raise HTTPException(status_code=409, detail="Ese horario está siendo reservado por otra persona")
+
+    return {
+        "ok": True,
+        "hold_token": hold.token,
+        "date": hold.date,
+        "time": hold.time,
+        "duration_min": hold.duration_min,
+        "expires_at": hold.expires_at.isoformat(),
+        "ttl_s": SLOT_HOLD_MINUTES * 60,
+    }
+
+@app.delete("/api/availability/hold/{token}")
+def release_slot(
+    token: str,
+    session: Session = Depends(get_session)
+):
+    """Público: libera un hold (el cliente cambió de horario o abandonó el formulario)."""
+    hold = session.exec(select(dbSlotHold).where(dbSlotHold.token == token)).first()
+    if hold:
+        session.delete(hold)
+        session.commit()
+    return {"ok": True}
 
 @app.get("/api/admin/availability")
 def admin_get_availability(
@@ -953,15 +1432,11 @@ def upsert_availability_day(
     if not body.date or not isinstance(body.slots, list):
         raise HTTPException(status_code=400, detail="Se requiere 'date' y 'slots' (lista)")
 
-    # 🔒 1) Buscar horarios ya reservados o confirmados
-    statement_booked = select(dbBooking).where(
-        dbBooking.date == body.date,
-        dbBooking.status.in_(["reserved", "confirmed"])
-    )
-    ocupados = set(b.time for b in session.exec(statement_booked).all())
+    # 🔒 1) Buscar horarios ya reservados o confirmados (todo el intervalo de cada booking)
+    ocupado = _ocupado_por_fecha(session, [body.date]).get(body.date, 0)
 
-    # 🔒 2) Filtrar slots enviados por el admin
-    slots_validos = [s for s in body.slots if s not in ocupados]
+    # 🔒 2) Los horarios de trabajos reservados se conservan aunque el admin los haya quitado
+    slots_validos = _slots_con_reservas(bool(body.enabled), body.slots, ocupado)
 
     statement_ovr = select(dbAvailabilityOverride).where(
         dbAvailabilityOverride.date == body.date
@@ -984,10 +1459,93 @@ def upsert_availability_day(
 
     return {
         "ok": True,
-        "bloqueados": list(ocupados),
+        "bloqueados": list(slots_de_mask(ocupado)),
         "slots_guardados": slots_validos
     }
 
+AVAILABILITY_BULK_MAX_DIAS = 400
+
+def _dias_bulk(body: AvailabilityBulkIn) -> Dict[str, Tuple[bool, List[str]]]:
+    """fecha -> (enabled, slots) a guardar, validando formato y tamaño."""
+    dias: Dict[str, Tuple[bool, List[str]]] = {}
+    if body.date_from or body.date_to:
+        try:
+            d = datetime.strptime(body.date_from or "", "%Y-%m-%d").date()
+            hasta = datetime.strptime(body.date_to or "", "%Y-%m-%d").date()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="date_from y date_to requeridos (YYYY-MM-DD)")
+        if hasta < d:
+            raise HTTPException(status_code=400, detail="date_to anterior a date_from")
+        if (hasta - d).days >= AVAILABILITY_BULK_MAX_DIAS:
+            raise HTTPException(status_code=400, detail=f"Máximo {AVAILABILITY_BULK_MAX_DIAS} días por pedido")
+        if any(w not in range(7) for w in body.weekdays):
+            raise HTTPException(status_code=400, detail="weekdays: 0 (lunes) a 6 (domingo)")
+        semana = set(body.weekdays) or set(range(7))
+        while d <= hasta:
+            if d.weekday() in semana:
+                dias[d.isoformat()] = (bool(body.enabled), list(body.slots))
+            d += timedelta(days=1)
+
+    for day in body.days:
+        try:
+            datetime.strptime(day.date, "%Y-%m-%d")
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Fecha inválida: {day.date}")
+        dias[day.date] = (bool(day.enabled), list(day.slots))
+
+    if not dias:
+        raise HTTPException(status_code=400, detail="Se requiere un rango (date_from/date_to) o 'days'")
+    if len(dias) > AVAILABILITY_BULK_MAX_DIAS:
+        raise HTTPException(status_code=400, detail=f"Máximo {AVAILABILITY_BULK_MAX_DIAS} días por pedido")
+    return dias
+
+@app.post("/api/availability/bulk")
+def upsert_availability_bulk(
+    body: AvailabilityBulkIn,
+    user=Depends(require_api_key),
+    session: Session = Depends(get_session)
+):
+    """
+    Igual que /api/availability/day pero para muchos días (ej. toda una temporada):
+    una consulta de bookings para el rango, una de overrides existentes y un solo commit.
+    Misma regla que el endpoint por día: los horarios que ocupa un trabajo reservado (su
+    intervalo completo) se conservan y se informan en "bloqueados".
+    """
+    dias = _dias_bulk(body)
+    fechas = sorted(dias)
+
+    # 🔒 1) Horarios reservados o confirmados de todo el rango (intervalo completo)
+    ocupado = _ocupado_por_fecha(session, fechas)
+
+    statement_ovr = select(dbAvailabilityOverride).where(dbAvailabilityOverride.date.in_(fechas))
+    existentes = {o.date: o for o in session.exec(statement_ovr).all()}
+
+    # 🔒 2) Un solo commit para todos los días
+    now = datetime.now(timezone.utc)
+    creados = actualizados = 0
+    for fecha in fechas:
+        enabled, slots = dias[fecha]
+        slots_validos = _slots_con_reservas(enabled, slots, ocupado.get(fecha, 0))
+        ovr = existentes.get(fecha)
+        if ovr:
+            ovr.enabled = enabled
+            ovr.slots = slots_validos
+            ovr.updated_at = now
+            actualizados += 1
+        else:
+            ovr = dbAvailabilityOverride(date=fecha, enabled=enabled, slots=slots_validos)
+            creados += 1
+        session.add(ovr)
+    session.commit()
+
+    return {
+        "ok": True,
+        "dias": len(fechas),
+        "creados": creados,
+        "actualizados": actualizados,
+        "bloqueados": {d: list(slots_de_mask(m)) for d, m in sorted(ocupado.items())},
+    }
+
 @app.delete("/api/availability/all")
 def delete_all_availability(
     user=Depends(require_api_key),
@@ -1031,7 +1589,8 @@ def admin_get_bookings_day(
     session: Session = Depends(get_session)
 ):
     """
-    Devuelve horarios ocupados (reserved/confirmed) para bloquearlos en el panel de disponibilidad.
+    Devuelve horarios ocupados (reserved/confirmed) para bloquearlos en el panel de disponibilidad:
+    todos los slots que tocan los intervalos, y cada reserva con su inicio, duración y fin.
     """
     if not date or len(date) != 10:
         raise HTTPException(status_code=400, detail="date inválida. Usar YYYY-MM-DD")
@@ -1040,9 +1599,22 @@ def admin_get_bookings_day(
         dbBooking.date == date,
         dbBooking.status.in_(["reserved", "confirmed"])
     )
-    ocupados = sorted(list(set(b.time for b in session.exec(statement).all() if b.time)))
+    bookings = sorted((b for b in session.exec(statement).all() if b.time), key=lambda b: b.time)
+    ocupado = 0
+    reservas = []
+    for b in bookings:
+        duracion = int(b.duration_min or SLOT_MIN)
+        ocupado |= mask_intervalo(b.time, duracion)
+        fin = _parse_hora(b.time) + timedelta(minutes=duracion)
+        reservas.append({
+            "quote_id": b.quote_id,
+            "time": b.time,
+            "duration_min": duracion,
+            "fin": fin.strftime("%H:%M"),
+            "status": b.status,
+        })
 
-    return {"ok": True, "date": date, "ocupados": ocupados}
+    return {"ok": True, "date": date, "ocupados": list(slots_de_mask(ocupado)), "reservas": reservas}
 
 
 # =========================
@@ -1109,8 +1681,10 @@ def add_block_rule(
         label=body.label
     )
     session.add(rule)
+    touch_block_rules(session)
     session.commit()
     session.refresh(rule)
+    BlockRuleIndex.rebuild(session)
     
     return {"ok": True, "id": str(rule.id), "slots_affected": slots_affected}
 
@@ -1133,7 +1707,9 @@ def delete_block_rule(
         raise HTTPException(404, "Regla no encontrada")
     
     session.delete(rule)
+    touch_block_rules(session)
     session.commit()
+    BlockRuleIndex.rebuild(session)
     return {"ok": True}
 
 @app.post("/api/admin/block-rules/toggle")
@@ -1157,6 +1733,7 @@ def toggle_block_rules(
         session.add(cfg)
         
     session.commit()
+    BlockRuleIndex.rebuild(session)
     return {"ok": True, "blocks_enabled": new_val}
 
 
@@ -1185,10 +1762,140 @@ def update_admin_config_vars(
 ):
     try:
         updated = DynamicConfig.update_values(session, payload)
-        return {"ok": True, "config": updated}
+        # Los tramos heurísticos dependen de FACTOR_TRAZADO / VEL_KMH
+        route_cache.invalidate("fallback")
+        return {"ok": True, "config": updated, "version": DynamicConfig.version()}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/admin/config-vars/simulate")
+def simulate_admin_config_vars(
+    body: ConfigSimulacionIn,
+    user=Depends(require_api_key),
+    session: Session = Depends(get_session)
+):
+    """
+    Admin: "qué pasa si" antes de guardar config-vars. Re-cotiza todos los presupuestos
+    guardados con la config actual y con la candidata, usando los dist_km / tiempo_viaje_min /
+    ayudante / peajes / viaticos / horas_reales persistidos (sin llamadas de ruteo).
+    Se leen solo esas columnas y se calcula con NumPy sobre columnas; no guarda nada.
+    """
+    actual = DynamicConfig.get_values(session)
+    try:
+        candidata = ConfigVars(**{
+            **actual, **{k: v for k, v in body.config.items() if k in EDITABLE_FIELDS}
+        }).model_dump()
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+    stmt = select(
+        dbQuote.id, dbQuote.estado, dbQuote.monto_estimado,
+        dbQuote.dist_km, dbQuote.tiempo_viaje_min, dbQuote.ayudante,
+        dbQuote.peajes, dbQuote.viaticos, dbQuote.horas_reales,
+    )
+    if not body.incluir_eliminados:
+        stmt = stmt.where(dbQuote.is_deleted == False)
+    if body.estados:
+        stmt = stmt.where(dbQuote.estado.in_(body.estados))
+    if body.desde:
+        stmt = stmt.where(dbQuote.created_at >= body.desde)
+    if body.hasta:
+        stmt = stmt.where(dbQuote.created_at <= body.hasta)
+    rows = session.exec(stmt.order_by(dbQuote.id)).all()
+
+    cambios = {k: {"actual": actual.get(k), "candidato": v} for k, v in candidata.items() if actual.get(k) != v}
+    if not rows:
+        vacio = np.zeros(0)
+        return {"ok": True, "cambios": cambios, "config_version": DynamicConfig.version(),
+                "resumen": resumen_deltas(vacio, vacio), "por_estado": {}, "items": []}
+
+    ids, estados, guardados, dist, tiempo, ayud, peajes, viat, hr = zip(*rows)
+    cols = {
+        "dist_km": [d or 0.0 for d in dist],
+        "tiempo_viaje_min": [t or 0 for t in tiempo],
+        "ayudante": [bool(a) for a in ayud],
+        "peajes": [p or 0 for p in peajes],
+        "viaticos": [v or 0.0 for v in viat],
+        "horas_reales": [h if h is not None else float("nan") for h in hr],
+    }
+    antes = montos_batch(actual, cols)
+    despues = montos_batch(candidata, cols)
+
+    estados_arr = np.asarray(estados, dtype=object)
+    por_estado = {}
+    for est in sorted(set(estados)):
+        m = estados_arr == est
+        por_estado[est] = resumen_deltas(antes[m], despues[m])
+
+    res = {
+        "ok": True,
+        "cambios": cambios,
+        "config_version": DynamicConfig.version(),
+        "resumen": resumen_deltas(antes, despues),
+        "por_estado": por_estado,
+    }
+    if body.detalle:
+        delta = np.round(despues - antes, 2)
+        pct = np.divide(delta * 100.0, antes, out=np.full(antes.shape, np.nan), where=antes != 0)
+        pct = [None if p != p else round(p, 2) for p in pct.tolist()]
+        res["items"] = [
+            {"id": i, "estado": e, "monto_guardado": g, "monto_actual": a, "monto_candidato": c, "delta": d, "delta_pct": p}
+            for i, e, g, a, c, d, p in zip(ids, estados, guardados, antes.tolist(), despues.tolist(), delta.tolist(), pct)
+        ]
+    # Todo ya son tipos nativos: JSONResponse directo evita jsonable_encoder sobre miles de filas
+    return JSONResponse(content=res)
+
+@app.get("/api/admin/cache-stats")
+def get_cache_stats(user=Depends(require_api_key)):
+    """
+    Contadores de hits/misses de los cachés de Maps y de la agenda (para dimensionarlos).
+    """
+    return {
+        "ok": True,
+        "geocode": geocode_cache.stats(),
+        "routes": route_cache.stats(),
+        "quote_previews": quote_preview_cache.stats(),
+        "availability": availability_cache.stats(),
+        "sse": slot_events.stats(),
+    }
+
+@app.get("/api/admin/jobs")
+def get_jobs(user=Depends(require_api_key)):
+    """Estado de las tareas periódicas (corridas, errores, último resultado)."""
+    return {"ok": True, **scheduler.stats()}
+
+@app.post("/api/admin/jobs/{name}/run")
+def run_job(name: str, user=Depends(require_api_key)):
+    """Corre una tarea periódica ya (ej. marcar realizados sin esperar el intervalo)."""
+    if not scheduler.run_now(name):
+        raise HTTPException(status_code=404, detail="Tarea inexistente")
+    return {"ok": True, "job": scheduler.stats()["jobs"][name]}
+
+@app.delete("/api/admin/cache/{name}")
+def invalidate_cache(
+    name: str,
+    provider: Optional[str] = Query(default=None, description="google | ors | fallback (solo routes)"),
+    user=Depends(require_api_key)
+):
+    """
+    Invalida los cachés: routes (opcionalmente por proveedor), geocode, availability o all.
+    """
+    if name not in ("routes", "geocode", "availability", "all"):
+        raise HTTPException(status_code=400, detail="Caché inválido. Usar routes | geocode | availability | all")
+    if provider and provider not in route_cache.PROVIDERS:
+        raise HTTPException(status_code=400, detail="provider inválido. Usar google | ors | fallback")
+
+    borrados = {}
+    if name in ("routes", "all"):
+        borrados["routes"] = route_cache.invalidate(provider)
+    if name in ("geocode", "all"):
+        borrados["geocode"] = geocode_cache.clear()
+    if name in ("availability", "all"):
+        BlockRuleIndex.invalidate()
+        availability_cache.invalidate_all()
+        borrados["availability"] = True
+    return {"ok": True, "deleted": borrados}
+
 @app.post("/api/admin/change-creds")
 def change_admin_creds(
     body: ChangeCredsIn,
@@ -1235,10 +1942,50 @@ def health():
 # @app.post("/api/admin/migrate-schema")
 # def migrate_schema(...)
 
+# Dependencias del re-cálculo en la edición admin (PATCH)
+CAMPOS_RUTEO = {"origen", "destino"}
+CAMPOS_PRECIO = {"ayudante", "peajes", "viaticos"}
+
+def _campos_costos(costos: Dict[str, float]) -> dict:
+    """Mapea el resultado de calcular_costos a las columnas de dbQuote."""
+    return {
+        "tiempo_servicio_min": int(costos["tiempo_servicio_min"]),
+        "horas_base": float(costos["horas_base"]),
+        "costo_tiempo_base": float(costos["costo_tiempo_base"]),
+        "mantenimiento": float(costos["mantenimiento"]),
+        "costo_tiempo": float(costos["costo_tiempo"]),
+        "costo_combustible": float(costos["costo_combustible"]),
+        "peajes_total": float(costos["peajes_total"]),
+        "costo_ayudante": float(costos["costo_ayudante"]),
+        "costo_chofer_parcial": float(costos["costo_chofer_parcial"]),
+        "costo_admin_parcial": float(costos["costo_admin_parcial"]),
+        "monto_estimado": float(costos["monto_estimado"]),
+    }
+
+def _datos_cliente(body: QuoteIn) -> dict:
+    """Campos que vienen tal cual del formulario (no dependen del ruteo ni de los costos)."""
+    return {
+        "nombre_cliente": body.nombre_cliente or body.__dict__.get("nombre_cliente") or "Consulta Admin",
+        "telefono": body.telefono,
+        "tipo_carga": body.tipo_carga,
+        "origen": body.origen,
+        "destino": body.destino,
+        "fecha": body.fecha,
+        "ayudante": body.ayudante,
+        "hora_inicio": body.hora_inicio,
+        "hora_fin": body.hora_fin,
+        "peajes": body.peajes,
+        "viaticos": body.viaticos,
+        "accepted_terms": body.accepted_terms,
+        "accepted_terms_at": (body.accepted_terms_at or (datetime.now(timezone.utc) if body.accepted_terms else None)),
+
+        # ✅ AÑADIDO: guardar turno elegido (si viene)
+        "fecha_turno": body.fecha_turno,
+        "hora_turno": body.hora_turno,
+    }
+
 def _calcular_desde_body(session: Session, body: QuoteIn) -> dict:
     # Normalizar
-    nombre = body.nombre_cliente or body.__dict__.get("nombre_cliente") or "Consulta Admin"
-    
     origen_val = body.origen or BASE_DIRECCION
     destino_val = body.destino or BASE_DIRECCION
 
@@ -1246,16 +1993,28 @@ def _calcular_desde_body(session: Session, body: QuoteIn) -> dict:
     destino_norm = _normalize_addr(destino_val)
     base_norm = _normalize_addr(BASE_DIRECCION)
 
-    # Tramos
-    t1 = calcular_ruta(session, base_norm, origen_norm)
-    t2 = calcular_ruta(session, origen_norm, destino_norm)
+    # Contexto de geocodificación del presupuesto: origen/destino arrancan ya (se persisten
+    # siempre) y el ruteo ORS / fallback reutiliza los mismos resultados.
+    # Si el navegador mandó coordenadas válidas (Autocomplete), se rutea coord→coord sin geocodificar.
+    geo = GeoContext()
+    origen_pt, orig_geo = _punto_ruteo(origen_norm, body.origen_lat, body.origen_lng, body.origen_place_id)
+    destino_pt, dest_geo = _punto_ruteo(destino_norm, body.destino_lat, body.destino_lng, body.destino_place_id)
+    for pt, addr, coords in ((origen_pt, origen_norm, orig_geo), (destino_pt, destino_norm, dest_geo)):
+        if coords:
+            geo.seed(pt, coords)
+        else:
+            # place_id o texto: las coords salen de geocodificar la dirección (una sola vez)
+            geo.prefetch(addr)
+            if pt != addr:
+                geo.alias(pt, addr)
+
+    # Tramos (base→origen, origen→destino y regreso a base, incluido)
+    t1, t2, t3 = calcular_tramos(session, base_norm, origen_pt, destino_pt, geo)
 
     dist_total = float(t1["dist_km"] + t2["dist_km"])
     tiempo_total_min = int(t1["tiempo_viaje_min"] + t2["tiempo_viaje_min"])
 
-    # Regreso a base (incluido)
     regreso_flag = True
-    t3 = calcular_ruta(session, destino_norm, base_norm)
     dist_total += float(t3["dist_km"])
     tiempo_total_min += int(t3["tiempo_viaje_min"])
 
@@ -1285,50 +2044,23 @@ def _calcular_desde_body(session: Session, body: QuoteIn) -> dict:
         extra_servicio_min=extra_servicio_min
     )
 
-    # Geocodificación para mayor precisión en mapas/notificaciones
-    orig_geo = _geocode_google(origen_norm)
-    dest_geo = _geocode_google(destino_norm)
+    orig_geo = orig_geo or geo.get(origen_norm)
+    dest_geo = dest_geo or geo.get(destino_norm)
 
-    doc = {
-        "nombre_cliente": nombre,
-        "telefono": body.telefono,
-        "tipo_carga": body.tipo_carga,
-        "origen": body.origen,
+    doc = _datos_cliente(body)
+    doc.update({
         "origen_lat": orig_geo["lat"] if orig_geo else None,
         "origen_lng": orig_geo["lng"] if orig_geo else None,
-        "destino": body.destino,
         "destino_lat": dest_geo["lat"] if dest_geo else None,
         "destino_lng": dest_geo["lng"] if dest_geo else None,
-        "fecha": body.fecha,
-        "ayudante": body.ayudante,
         "regreso_base": regreso_flag,
-        "hora_inicio": body.hora_inicio,
-        "hora_fin": body.hora_fin,
         "horas_reales": horas_reales,
-        "peajes": body.peajes,
-        "viaticos": body.viaticos,
-        "accepted_terms": body.accepted_terms,
-        "accepted_terms_at": (body.accepted_terms_at or (datetime.now(timezone.utc) if body.accepted_terms else None)),
-
-        # ✅ AÑADIDO: guardar turno elegido (si viene)
-        "fecha_turno": body.fecha_turno,
-        "hora_turno": body.hora_turno,
 
         # totales
         "dist_km": round(dist_total, 3),
         "tiempo_viaje_min": int(tiempo_total_min),
-        "tiempo_servicio_min": int(costos["tiempo_servicio_min"]),
-        "horas_base": float(costos["horas_base"]),
-        # desgloses
-        "costo_tiempo_base": float(costos["costo_tiempo_base"]),
-        "mantenimiento": float(costos["mantenimiento"]),
-        "costo_tiempo": float(costos["costo_tiempo"]),
-        "costo_combustible": float(costos["costo_combustible"]),
-        "peajes_total": float(costos["peajes_total"]),
-        "costo_ayudante": float(costos["costo_ayudante"]),
-        "costo_chofer_parcial": float(costos["costo_chofer_parcial"]),
-        "costo_admin_parcial": float(costos["costo_admin_parcial"]),
-        "monto_estimado": float(costos["monto_estimado"]),
+        # tiempo de servicio + desgloses
+        **_campos_costos(costos),
         # tramos
         "tramo_base_origen_km": round(t1["dist_km"], 3),
         "tramo_origen_destino_km": round(t2["dist_km"], 3),
@@ -1338,7 +2070,67 @@ def _calcular_desde_body(session: Session, body: QuoteIn) -> dict:
         "tramo_destino_base_min": int(t3["tiempo_viaje_min"]),
         # metadata
         "extra_servicio_min": int(extra_servicio_min),
-    }
+    })
+    return doc
+
+# =========================
+# Token preview → send
+# =========================
+# El preview guarda lo calculado (ruteo + costos) en quote_preview_cache y devuelve un token
+# firmado con solo {id opaco, hash de los inputs}: /api/quote/send lo persiste sin volver a
+# rutear, siempre que los datos que afectan el cálculo no hayan cambiado. Los costos internos
+# (los que _quote_public no expone) nunca viajan al navegador.
+QUOTE_TOKEN_TTL_S = int(os.getenv("QUOTE_TOKEN_TTL_S", "900"))
+# Sin un secreto real cualquiera podría armar tokens válidos para ids ajenos.
+# Sin JWT_SECRET configurado no se emiten ni aceptan tokens (send siempre recalcula).
+_QUOTE_TOKEN_SECRET = os.getenv("JWT_SECRET") or ""
+QUOTE_TOKEN_ENABLED = bool(_QUOTE_TOKEN_SECRET) and _QUOTE_TOKEN_SECRET != "change_this"
+_quote_signer = URLSafeTimedSerializer(_QUOTE_TOKEN_SECRET, salt="quote-preview") if QUOTE_TOKEN_ENABLED else None
+if not QUOTE_TOKEN_ENABLED:
+    print("[quote] JWT_SECRET no configurado: /api/quote/send recalcula siempre (sin quote_token)")
+
+# Campos de QuoteIn que alimentan _calcular_desde_body más allá de _datos_cliente
+_CAMPOS_CALCULO = (
+    "origen", "destino", "ayudante", "peajes", "viaticos",
+    "horas_reales", "hora_inicio", "hora_fin",
+    "origen_lat", "origen_lng", "origen_place_id",
+    "destino_lat", "destino_lng", "destino_place_id",
+)
+
+def _hash_calculo(session: Session, body: QuoteIn) -> str:
+    """Inputs del cálculo + config de precios vigente: si el admin la cambia, el token ya no vale."""
+    data = {k: getattr(body, k, None) for k in _CAMPOS_CALCULO}
+    data["_config"] = DynamicConfig.marca(session)
+    raw = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+def _emitir_quote_token(session: Session, body: QuoteIn, doc: dict) -> Optional[str]:
+    if not QUOTE_TOKEN_ENABLED:
+        return None
+    cliente = _datos_cliente(body)
+    calculado = {k: v for k, v in doc.items() if k not in cliente}
+    h = _hash_calculo(session, body)
+    preview_id = secrets.token_urlsafe(16)
+    quote_preview_cache.put(preview_id, h, calculado, QUOTE_TOKEN_TTL_S)
+    return _quote_signer.dumps({"id": preview_id, "h": h})
+
+def _doc_desde_token(session: Session, body: QuoteIn) -> Optional[dict]:
+    """Doc listo para persistir si el token es válido, no venció y los inputs (y la config) coinciden."""
+    token = getattr(body, "quote_token", None)
+    if not token or not QUOTE_TOKEN_ENABLED:
+        return None
+    try:
+        payload = _quote_signer.loads(token, max_age=QUOTE_TOKEN_TTL_S)
+    except (BadSignature, SignatureExpired):
+        return None
+    h = _hash_calculo(session, body)
+    if not isinstance(payload, dict) or payload.get("h") != h:
+        return None
+    calculado = quote_preview_cache.get(str(payload.get("id")), h)
+    if calculado is None:
+        return None
+    doc = _datos_cliente(body)
+    doc.update(calculado)
     return doc
 
 # ⛔ CAMBIO: /api/quote ahora NO persiste; solo devuelve preview
@@ -1350,7 +2142,45 @@ def preview_quote(
     doc = _calcular_desde_body(session, body)
     # Creamos un objeto dbQuote temporalmente (sin guardar) para serializar
     temp_quote = dbQuote(**doc, estado="preview")
-    return {"ok": True, "quote": _quote_public(temp_quote)}
+    return {"ok": True, "quote": _quote_public(temp_quote), "quote_token": _emitir_quote_token(session, body, doc)}
+
+QUOTE_BATCH_MAX_ROWS = int(os.getenv("QUOTE_BATCH_MAX_ROWS", "50000"))
+
+@app.post("/api/quote/batch")
+def quote_batch(
+    body: QuoteBatchIn,
+    formato: str = Query(default="filas", description="filas | columnas"),
+    user=Depends(require_api_key),
+    session: Session = Depends(get_session)
+):
+    """
+    Admin: cotiza muchas filas (dist_km, tiempo_viaje_min, ayudante, peajes, viaticos) de una vez.
+    Mismo desglose y redondeo que calcular_costos, calculado con NumPy sobre columnas.
+    formato=columnas devuelve una lista por campo (más liviano para miles de filas).
+    """
+    if formato not in ("filas", "columnas"):
+        raise HTTPException(status_code=400, detail="formato inválido. Usar filas | columnas")
+    n = len(body.rows)
+    if n > QUOTE_BATCH_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"Máximo {QUOTE_BATCH_MAX_ROWS} filas por request")
+
+    conf = DynamicConfig.get_values(session)
+    rows = body.rows
+    cols = costos_batch(
+        conf,
+        dist_km=[r.dist_km for r in rows],
+        tiempo_viaje_min=[r.tiempo_viaje_min for r in rows],
+        ayudante=[r.ayudante for r in rows],
+        peajes=[r.peajes for r in rows],
+        viaticos=[r.viaticos for r in rows],
+        horas_reales=[r.horas_reales if r.horas_reales is not None else float("nan") for r in rows],
+    )
+    res = {"ok": True, "count": n, "config_version": DynamicConfig.version()}
+    if formato == "columnas":
+        res["columns"] = columnas_costos(cols)
+    else:
+        res["items"] = filas_costos(cols)
+    return res
 
 # ✅ Nuevo: enviar y guardar (sin ID previo) + RESERVA ATÓMICA
 @app.post("/api/quote/send")
@@ -1366,81 +2196,79 @@ def send_quote_nuevo(
     # 1) Detectar si es un Lead (sin horario asignado por el cliente)
     is_lead = (not body.fecha_turno or not body.hora_turno or body.fecha_turno == "1970-01-01")
 
-    booking = None
     day_ovr = None
 
+    hold = None
     if not is_lead:
-        # 2) Validar que no sea en el pasado
-        hoy_ar = datetime.now(AR_TZ)
-        try:
-            req_dt = datetime.strptime(f"{body.fecha_turno} {body.hora_turno}", "%Y-%m-%d %H:%M").replace(tzinfo=AR_TZ)
-            if req_dt < hoy_ar - timedelta(minutes=5):
-                raise HTTPException(status_code=409, detail="Ese horario ya pasó")
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Formato de fecha/hora inválido")
-
-        # 3) Validar contra overrides del admin
+        # 2) Con un hold vigente del mismo horario ya está todo validado
+        hold = _hold_vigente(session, getattr(body, "hold_token", None), body.fecha_turno, body.hora_turno)
+    if hold:
         statement_ovr = select(dbAvailabilityOverride).where(dbAvailabilityOverride.date == body.fecha_turno)
         day_ovr = session.exec(statement_ovr).first()
-        
-        if day_ovr:
-            if not day_ovr.enabled:
-                raise HTTPException(status_code=409, detail="El día seleccionado no está habilitado")
-            if day_ovr.slots and body.hora_turno not in day_ovr.slots:
-                raise HTTPException(status_code=409, detail="El horario ya no está disponible")
-        else:
-            if body.hora_turno not in DEFAULT_SLOTS:
-                raise HTTPException(status_code=409, detail="Horario no válido para este servicio")
-
-        # 4) RESERVA en la tabla bookings
-        statement_check = select(dbBooking).where(
-            dbBooking.date == body.fecha_turno,
-            dbBooking.time == body.hora_turno,
-            dbBooking.status.in_(["reserved", "confirmed"])
-        )
-        existing = session.exec(statement_check).first()
-        if existing:
+    elif not is_lead:
+        # 3) Pasado / overrides del admin / grilla
+        day_ovr = _validar_turno(session, body.fecha_turno, body.hora_turno)
+
+        # 4) Chequeo rápido (lectura) para no rutear en vano un horario ya tomado.
+        #    La garantía real es el chequeo de intervalos con el día bloqueado (paso 6).
+        if _booking_superpuesto(session, body.fecha_turno, body.hora_turno):
             raise HTTPException(status_code=409, detail="Ese horario ya fue reservado por otra persona")
+        if _hold_ajeno(session, body.fecha_turno, body.hora_turno):
+            raise HTTPException(status_code=409, detail="Ese horario está siendo reservado por otra persona")
 
-        try:
-            booking = dbBooking(
-                quote_id="PENDING",
+    # 5) Calcular el presupuesto (sin escribir nada todavía: el ruteo puede tardar).
+    #    Cerrar la transacción de lectura devuelve la conexión al pool mientras tanto.
+    session.commit()
+    try:
+        # Si viene el token del preview y los inputs coinciden, no se recalcula
+        data = _doc_desde_token(session, body) or _calcular_desde_body(session, body)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al procesar presupuesto: {str(e)}")
+
+    # 6) Reserva + presupuesto en UNA transacción
+    try:
+        quote = dbQuote(**data, estado="sent")
+        session.add(quote)
+        session.flush()  # asigna quote.id
+
+        if not is_lead:
+            # El trabajo ocupa [hora, hora + tiempo_servicio_min): nadie más puede reservar el
+            # día mientras se chequea la superposición (el índice único solo ve el inicio)
+            duracion = int(data.get("tiempo_servicio_min") or SLOT_MIN)
+            lock_dia(session, body.fecha_turno)
+            if _booking_superpuesto(session, body.fecha_turno, body.hora_turno, duracion):
+                session.rollback()
+                raise HTTPException(status_code=409, detail="El trabajo no entra antes de la próxima reserva de ese día")
+            if _hold_ajeno(session, body.fecha_turno, body.hora_turno, duracion,
+                           excluir_token=hold.token if hold else None):
+                session.rollback()
+                raise HTTPException(status_code=409, detail="Ese horario está siendo reservado por otra persona")
+            session.add(dbBooking(
+                quote_id=str(quote.id),
                 date=body.fecha_turno,
                 time=body.hora_turno,
+                duration_min=duracion,
                 status="reserved"
-            )
-            session.add(booking)
-            session.commit() # Flush inicial para asegurar reserva
-        except Exception as e:
-            session.rollback()
-            raise HTTPException(status_code=409, detail="Ese horario ya fue reservado (error de concurrencia)")
-
-        # 5) Sincronizar 'availability'
-        if day_ovr and day_ovr.slots:
-            if body.hora_turno in day_ovr.slots:
-                new_slots = [s for s in day_ovr.slots if s != body.hora_turno]
-                day_ovr.slots = new_slots
+            ))
+            if hold:
+                # El hold se convierte en la reserva
+                session.delete(hold)
+            # Sincronizar 'availability'
+            if day_ovr and day_ovr.slots and body.hora_turno in day_ovr.slots:
+                day_ovr.slots = [s for s in day_ovr.slots if s != body.hora_turno]
                 session.add(day_ovr)
 
-    # 6) Calcular y guardar presupuesto
-    try:
-        data = _calcular_desde_body(session, body)
-        quote = dbQuote(**data, estado="sent")
-        session.add(quote)
         session.commit()
-        session.refresh(quote)
-        
-        # Actualizar el booking con el ID real (solo si se creó uno)
-        if booking:
-            booking.quote_id = str(quote.id)
-            session.add(booking)
-            session.commit()
-        
+    except IntegrityError:
+        # Otro request reservó un horario superpuesto entre el chequeo y el commit
+        session.rollback()
+        raise HTTPException(status_code=409, detail="Ese horario ya fue reservado por otra persona")
+    except HTTPException:
+        raise
     except Exception as e:
-        # Rollback del booking en caso de error
-        if booking:
-            session.delete(booking)
-            session.commit()
+        session.rollback()
         raise HTTPException(status_code=500, detail=f"Error al procesar presupuesto: {str(e)}")
 
     # 7) Notificar
@@ -1531,6 +2359,31 @@ def confirmar_quote(
     if not quote:
         raise HTTPException(status_code=404, detail="Presupuesto no encontrado")
 
+    # ✅ Fallback: si el booking no existía (raro pero posible en migración) se crea con el
+    # mismo chequeo de intervalos que /api/quote/send, ANTES de confirmar nada
+    ft = quote.fecha_turno
+    ht = quote.hora_turno
+    booking = None
+    if ft and ht:
+        statement_b = select(dbBooking).where(
+            dbBooking.quote_id == str(quote.id),
+            dbBooking.date == ft,
+            dbBooking.time == ht
+        )
+        booking = session.exec(statement_b).first()
+        if not booking:
+            duracion = int(quote.tiempo_servicio_min or SLOT_MIN)
+            lock_dia(session, ft)
+            if _booking_superpuesto(session, ft, ht, duracion):
+                session.rollback()
+                raise HTTPException(status_code=409, detail="El horario del presupuesto se superpone con otra reserva")
+            booking = dbBooking(
+                quote_id=str(quote.id),
+                date=ft,
+                time=ht,
+                duration_min=duracion,
+            )
+
     if quote.estado != "confirmado":
         quote.estado = "confirmado"
         quote.confirmado_en = datetime.now(timezone.utc)
@@ -1538,37 +2391,18 @@ def confirmar_quote(
             quote.fecha_hora_preferida = body.fecha_hora_preferida
             quote.notas_confirmacion = body.notas
         session.add(quote)
-        session.commit()
-        session.refresh(quote)
 
-    # ✅ marcar booking como confirmado (si existe)
+    # ✅ marcar booking como confirmado (misma transacción que el presupuesto)
+    if booking:
+        booking.status = "confirmed"
+        booking.confirmed_at = datetime.now(timezone.utc)
+        session.add(booking)
     try:
-        ft = quote.fecha_turno
-        ht = quote.hora_turno
-        if ft and ht:
-            statement_b = select(dbBooking).where(
-                dbBooking.quote_id == str(quote.id),
-                dbBooking.date == ft,
-                dbBooking.time == ht
-            )
-            booking = session.exec(statement_b).first()
-            if booking:
-                booking.status = "confirmed"
-                booking.confirmed_at = datetime.now(timezone.utc)
-                session.add(booking)
-            else:
-                # Fallback: crear booking si no existía (raro pero posible en migración)
-                booking = dbBooking(
-                    quote_id=str(quote.id),
-                    date=ft,
-                    time=ht,
-                    status="confirmed",
-                    confirmed_at=datetime.now(timezone.utc)
-                )
-                session.add(booking)
-            session.commit()
-    except Exception as e:
-        print(f"Error confirmando booking: {e}")
+        session.commit()
+    except IntegrityError:
+        session.rollback()
+        raise HTTPException(status_code=409, detail="El horario del presupuesto se superpone con otra reserva")
+    session.refresh(quote)
 
     doc_dict = quote.model_dump()
     if background:
@@ -1646,6 +2480,43 @@ async def ratelimit_test(request: Request):
 # =========================
 # Admin (listado simple)
 # =========================
+# Columnas que lee el listado (select por columnas: filas-tupla, sin hidratar dbQuote entero).
+# _quote_public/_serialize_quote solo usan atributos, así que sirven igual para esas filas.
+REQUESTS_COLS_COMPLETO = [
+    dbQuote.id, dbQuote.nombre_cliente, dbQuote.telefono, dbQuote.tipo_carga,
+    dbQuote.origen, dbQuote.destino, dbQuote.fecha, dbQuote.ayudante, dbQuote.regreso_base,
+    dbQuote.dist_km, dbQuote.tiempo_viaje_min, dbQuote.tiempo_servicio_min,
+    dbQuote.costo_tiempo, dbQuote.costo_combustible, dbQuote.monto_estimado, dbQuote.estado,
+    dbQuote.fecha_turno, dbQuote.hora_turno,
+    dbQuote.tramo_base_origen_km, dbQuote.tramo_origen_destino_km, dbQuote.tramo_destino_base_km,
+    dbQuote.tramo_base_origen_min, dbQuote.tramo_origen_destino_min, dbQuote.tramo_destino_base_min,
+    dbQuote.created_at, dbQuote.extra_servicio_min, dbQuote.costo_tiempo_base,
+    dbQuote.mantenimiento, dbQuote.costo_ayudante, dbQuote.peajes_total,
+]
+# Lo que muestra la tabla del panel; el resto va por GET /api/requests/{id}
+REQUESTS_COLS_COMPACTO = [
+    dbQuote.id, dbQuote.nombre_cliente, dbQuote.telefono, dbQuote.tipo_carga,
+    dbQuote.origen, dbQuote.destino, dbQuote.fecha, dbQuote.fecha_turno, dbQuote.hora_turno,
+    dbQuote.estado, dbQuote.monto_estimado, dbQuote.ayudante, dbQuote.created_at,
+]
+
+def _quote_compacto(row) -> dict:
+    return {
+        "id": row.id,
+        "nombre_cliente": row.nombre_cliente,
+        "telefono": row.telefono,
+        "tipo_carga": row.tipo_carga,
+        "origen": row.origen,
+        "destino": row.destino,
+        "fecha": row.fecha,
+        "fecha_turno": row.fecha_turno,
+        "hora_turno": row.hora_turno,
+        "estado": row.estado,
+        "monto_estimado": float(row.monto_estimado),
+        "ayudante": bool(row.ayudante),
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+    }
+
 def _serialize_quote(doc: dbQuote) -> dict:
     d = _quote_public(doc)
     d.update({
@@ -1670,14 +2541,49 @@ def _serialize_quote(doc: dbQuote) -> dict:
 # ✅ AHORA REQUIERE TOKEN (tu frontend ya lo manda)
 from datetime import timezone as dt_timezone  # arriba ya importaste timezone, esto es opcional
 
+REQUESTS_ESTADOS = {
+    "pending": ["sent", "rechazado", "confirmado"],
+    "historicos": ["realizado", "anulado", "cancelado"],  # Incluye realizados y anulados
+    "all": None,
+}
+REQUESTS_MAX_LIMIT = 500
+
+def _cursor_requests(created_at: datetime, qid: int) -> str:
+    """Cursor opaco de la paginación: posición (created_at, id) del último item devuelto."""
+    raw = f"{created_at.isoformat()}|{qid}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _parse_cursor_requests(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, qid = raw.rsplit("|", 1)
+        return datetime.fromisoformat(ts), int(qid)
+    except Exception:
+        raise HTTPException(status_code=400, detail="cursor inválido")
+
+def _inicio_dia_ar(fecha: str, campo: str) -> datetime:
+    """00:00 hora AR de fecha (YYYY-MM-DD), en UTC (así se guarda created_at)."""
+    try:
+        d = datetime.strptime(fecha, "%Y-%m-%d").replace(tzinfo=AR_TZ)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{campo}: formato YYYY-MM-DD")
+    return d.astimezone(timezone.utc)
+
 @app.get("/api/requests")
 def listar_requests(
     status: str = Query(default="pending", description="pending | historicos | all"),
+    limit: Optional[int] = Query(default=None, ge=1, le=REQUESTS_MAX_LIMIT, description="Tamaño de página (sin limit: todo, como antes)"),
+    cursor: Optional[str] = Query(default=None, description="next_cursor de la página anterior"),
+    desde: Optional[str] = Query(default=None, description="created_at >= (YYYY-MM-DD, hora AR)"),
+    hasta: Optional[str] = Query(default=None, description="created_at <= (YYYY-MM-DD, hora AR, inclusive)"),
+    fecha_turno: Optional[str] = Query(default=None, description="YYYY-MM-DD"),
+    estado: Optional[str] = Query(default=None, description="Uno o más estados separados por coma (dentro del status)"),
+    q: Optional[str] = Query(default=None, description="Texto libre: nombre, teléfono, origen, destino o tipo de carga"),
+    vista: str = Query(default="completo", description="completo | compacto (solo columnas de la tabla)"),
     user=Depends(require_api_key),
     session: Session = Depends(get_session)
 ):
-    # 1) marcar realizados (confirmados vencidos)
-    _marcar_realizados(session)
+    # 1) marcar realizados: lo hace la tarea periódica "marcar_realizados" (el listado es solo lectura)
 
     # 2) hoy AR (YYYY-MM-DD)
     today_str = _today_ar_str()
@@ -1687,29 +2593,186 @@ def listar_requests(
     # Anteriormente se borraban aquí los pedidos 'sent' o 'rechazado' con fecha anterior a hoy.
 
     # 4) Construir filtro según estado solicitado
-    if st == "pending":
-        statement = select(dbQuote).where(
-            dbQuote.estado.in_(["sent", "rechazado", "confirmado"]),
-            dbQuote.is_deleted == False
-        ).order_by(dbQuote.created_at.desc())
-
-    elif st == "historicos":
-        # Incluye realizados y anulados
-        statement = select(dbQuote).where(
-            dbQuote.estado.in_(["realizado", "anulado", "cancelado"]),
-            dbQuote.is_deleted == False
-        ).order_by(dbQuote.created_at.desc())
-
-    elif st == "all":
-        statement = select(dbQuote).where(dbQuote.is_deleted == False).order_by(dbQuote.created_at.desc())
+    if st not in REQUESTS_ESTADOS:
+        raise HTTPException(status_code=400, detail="status inválido. Usar pending | historicos | all")
 
-    else:
+    if vista not in ("completo", "compacto"):
+        raise HTTPException(status_code=400, detail="vista inválida. Usar completo | compacto")
+    compacto = vista == "compacto"
+
+    statement = select(*(REQUESTS_COLS_COMPACTO if compacto else REQUESTS_COLS_COMPLETO)).where(dbQuote.is_deleted == False)
+    estados = REQUESTS_ESTADOS[st]
+    if estado:
+        pedidos = [e.strip().lower() for e in estado.split(",") if e.strip()]
+        estados = [e for e in pedidos if estados is None or e in estados]
+    if estados is not None:
+        statement = statement.where(dbQuote.estado.in_(estados))
+
+    # 5) Filtros del panel (en SQL, no en el front)
+    if desde:
+        statement = statement.where(dbQuote.created_at >= _inicio_dia_ar(desde, "desde"))
+    if hasta:
+        statement = statement.where(dbQuote.created_at < _inicio_dia_ar(hasta, "hasta") + timedelta(days=1))
+    if fecha_turno:
+        statement = statement.where(dbQuote.fecha_turno == fecha_turno)
+    busqueda = condicion_busqueda(q)
+    if busqueda is not None:
+        statement = statement.where(busqueda)
+
+    # 6) Keyset: (created_at, id) descendente, sin OFFSET (cada página cuesta lo mismo)
+    if cursor:
+        c_ts, c_id = _parse_cursor_requests(cursor)
+        statement = statement.where(or_(
+            dbQuote.created_at < c_ts,
+            and_(dbQuote.created_at == c_ts, dbQuote.id < c_id),
+        ))
+    statement = statement.order_by(dbQuote.created_at.desc(), dbQuote.id.desc())
+    if limit:
+        statement = statement.limit(limit + 1)
+
+    rows = session.exec(statement).all()
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _cursor_requests(rows[-1].created_at, rows[-1].id)
+    serializar = _quote_compacto if compacto else _serialize_quote
+    items = [serializar(row) for row in rows]
+
+    return Response(
+        content=_json_bytes({"items": items, "status": st, "today": today_str, "next_cursor": next_cursor}),
+        media_type="application/json",
+    )
+
+BUSQUEDA_MAX_LIMIT = 200
+
+@app.get("/api/requests/search")
+def buscar_requests(
+    q: str = Query(..., min_length=1, description="Nombre, teléfono (con o sin separadores), origen, destino o tipo de carga"),
+    status: str = Query(default="all", description="pending | historicos | all"),
+    limit: int = Query(default=50, ge=1, le=BUSQUEDA_MAX_LIMIT),
+    user=Depends(require_api_key),
+    session: Session = Depends(get_session)
+):
+    """Búsqueda indexada (FTS5 / pg_trgm); devuelve filas compactas, las más nuevas primero."""
+    st = (status or "all").strip().lower()
+    if st not in REQUESTS_ESTADOS:
         raise HTTPException(status_code=400, detail="status inválido. Usar pending | historicos | all")
+    busqueda = condicion_busqueda(q)
+    if busqueda is None:
+        raise HTTPException(status_code=400, detail="Búsqueda vacía")
+
+    # IS NOT TRUE (y no == False): así SQLite no elige recorrer ix_quotes_listado en orden
+    # y arranca por las coincidencias del índice de texto
+    statement = select(*REQUESTS_COLS_COMPACTO).where(dbQuote.is_deleted.is_not(True), busqueda)
+    if REQUESTS_ESTADOS[st] is not None:
+        statement = statement.where(dbQuote.estado.in_(REQUESTS_ESTADOS[st]))
+    statement = statement.order_by(dbQuote.created_at.desc(), dbQuote.id.desc()).limit(limit)
+
+    items = [_quote_compacto(row) for row in session.exec(statement).all()]
+    return Response(
+        content=_json_bytes({"ok": True, "q": q, "items": items}),
+        media_type="application/json",
+    )
+
+@app.get("/api/requests/{quote_id}")
+def detalle_request(
+    quote_id: str,
+    user=Depends(require_api_key),
+    session: Session = Depends(get_session)
+):
+    """Detalle completo de un presupuesto (el listado compacto no trae desgloses ni notas)."""
+    try:
+        qid = int(quote_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="ID inválido")
 
-    quotes_list = session.exec(statement).all()
-    items = [_serialize_quote(q) for q in quotes_list]
+    quote = session.get(dbQuote, qid)
+    if not quote or quote.is_deleted:
+        raise HTTPException(status_code=404, detail="Presupuesto no encontrado")
 
-    return {"items": items, "status": st, "today": today_str}
+    detalle = quote.model_dump(mode="json")
+    detalle.update(_serialize_quote(quote))
+    return {"ok": True, "quote": detalle}
+
+# =========================
+# Exportación (contabilidad)
+# =========================
+EXPORT_TABLAS = {"quotes": dbQuote, "bookings": dbBooking}
+
+@app.get("/api/admin/export/{tabla}")
+def exportar_tabla(
+    tabla: str,
+    formato: str = Query(default="csv", description="csv | ndjson"),
+    month: Optional[str] = Query(default=None, description="YYYY-MM (atajo de desde/hasta)"),
+    desde: Optional[str] = Query(default=None, description="YYYY-MM-DD (inclusive)"),
+    hasta: Optional[str] = Query(default=None, description="YYYY-MM-DD (inclusive)"),
+    por: str = Query(default="created_at", description="quotes: created_at | fecha_turno"),
+    incluir_eliminados: bool = Query(default=False),
+    gzip: bool = Query(default=False),
+    user=Depends(require_api_key)
+):
+    """
+    Exporta quotes o bookings completos en streaming (memoria constante sin importar
+    el tamaño del historial). bookings filtra por date; quotes por created_at (día AR)
+    o por fecha_turno.
+    """
+    modelo = EXPORT_TABLAS.get(tabla)
+    if modelo is None:
+        raise HTTPException(status_code=400, detail="Tabla inválida. Usar quotes | bookings")
+    if formato not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="formato inválido. Usar csv | ndjson")
+    if por not in ("created_at", "fecha_turno"):
+        raise HTTPException(status_code=400, detail="por inválido. Usar created_at | fecha_turno")
+
+    if month:
+        y, m = _parse_mes(month)
+        desde = f"{y:04d}-{m:02d}-01"
+        hasta = f"{y:04d}-{m:02d}-{calendar.monthrange(y, m)[1]:02d}"
+    for valor, campo in ((desde, "desde"), (hasta, "hasta")):
+        if valor:
+            try:
+                datetime.strptime(valor, "%Y-%m-%d")
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"{campo}: formato YYYY-MM-DD")
+
+    columnas = [c.name for c in modelo.__table__.columns]
+    statement = select(*modelo.__table__.columns)
+    if modelo is dbQuote:
+        if not incluir_eliminados:
+            statement = statement.where(dbQuote.is_deleted == False)
+        if por == "created_at":
+            if desde:
+                statement = statement.where(dbQuote.created_at >= _inicio_dia_ar(desde, "desde"))
+            if hasta:
+                statement = statement.where(dbQuote.created_at < _inicio_dia_ar(hasta, "hasta") + timedelta(days=1))
+        else:
+            if desde:
+                statement = statement.where(dbQuote.fecha_turno >= desde)
+            if hasta:
+                statement = statement.where(dbQuote.fecha_turno <= hasta)
+    else:
+        if desde:
+            statement = statement.where(dbBooking.date >= desde)
+        if hasta:
+            statement = statement.where(dbBooking.date <= hasta)
+    tandas = filas_stream(statement, modelo.id)
+    if formato == "csv":
+        chunks = csv_stream(columnas, tandas)
+        media_type = "text/csv; charset=utf-8"
+    else:
+        chunks = ndjson_stream(columnas, tandas, _json_bytes)
+        media_type = "application/x-ndjson"
+
+    nombre = f"{tabla}_{month or (desde or 'inicio') + '_' + (hasta or 'hoy')}.{formato}"
+    if gzip:
+        chunks = gzip_stream(chunks)
+        media_type = "application/gzip"
+        nombre += ".gz"
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{nombre}"'},
+    )
 
 @app.post("/api/requests/{quote_id}/confirm")
 def admin_confirmar(
@@ -1910,37 +2973,68 @@ def admin_patch_request(
 
     # 1) Actualizar campos del modelo (solo los que vienen en el body)
     update_data = body.model_dump(exclude_unset=True, by_alias=False)
+    cambiados = set()
     for key, value in update_data.items():
         if hasattr(quote, key):
+            if getattr(quote, key) != value:
+                cambiados.add(key)
             setattr(quote, key, value)
 
-    # 2) Re-calcular costos basándose en los nuevos datos
-    # Usamos QuoteIn para disparar la misma lógica de cálculo que en el frontend
-    temp_in = QuoteIn(
-        nombre=quote.nombre_cliente,
-        telefono=quote.telefono,
-        tipo_carga=quote.tipo_carga,
-        origen=quote.origen,
-        destino=quote.destino,
-        fecha=quote.fecha,
-        ayudante=quote.ayudante,
-        peajes=quote.peajes,
-        viaticos=quote.viaticos,
-        fecha_turno=quote.fecha_turno,
-        hora_turno=quote.hora_turno
-    )
-    
-    try:
-        new_doc = _calcular_desde_body(session, temp_in)
-        # Sincronizar campos calculados (sin tocar metadatos como estado, id o created_at)
-        FORBIDDEN_FIELDS = ['id', 'estado', 'created_at', 'confirmado_en', 'sent_at']
-        for key, value in new_doc.items():
-            if hasattr(quote, key) and key not in FORBIDDEN_FIELDS:
+    # 2) Re-cálculo según dependencias de lo que cambió:
+    #    - direcciones → re-rutear todo
+    #    - ayudante / peajes / viaticos → solo calcular_costos sobre dist_km / tiempo_viaje_min guardados
+    #    - el resto (nombre, teléfono, turno, notas...) → nada
+    if cambiados & CAMPOS_RUTEO:
+        recalculo = "ruta"
+    elif cambiados & CAMPOS_PRECIO:
+        recalculo = "costos"
+    else:
+        recalculo = "ninguno"
+
+    if recalculo == "ruta":
+        # Usamos QuoteIn para disparar la misma lógica de cálculo que en el frontend
+        temp_in = QuoteIn(
+            nombre=quote.nombre_cliente,
+            telefono=quote.telefono,
+            tipo_carga=quote.tipo_carga,
+            origen=quote.origen,
+            destino=quote.destino,
+            fecha=quote.fecha,
+            ayudante=quote.ayudante,
+            peajes=quote.peajes,
+            viaticos=quote.viaticos,
+            fecha_turno=quote.fecha_turno,
+            hora_turno=quote.hora_turno
+        )
+        try:
+            new_doc = _calcular_desde_body(session, temp_in)
+            # Sincronizar solo lo calculado (los datos del cliente ya se aplicaron arriba)
+            cliente = _datos_cliente(temp_in)
+            for key, value in new_doc.items():
+                if hasattr(quote, key) and key not in cliente:
+                    setattr(quote, key, value)
+        except Exception as e:
+            print(f"Error recalculando pedido {qid}: {e}")
+            # No fallamos si el cálculo falla, al menos guardamos los cambios manuales
+
+    elif recalculo == "costos":
+        try:
+            costos = calcular_costos(
+                session=session,
+                dist_km=float(quote.dist_km or 0),
+                tiempo_viaje_min=int(quote.tiempo_viaje_min or 0),
+                ayudante=bool(quote.ayudante),
+                horas_reales=None,  # igual que el re-cálculo completo
+                peajes=int(quote.peajes or 0),
+                viaticos=float(quote.viaticos or 0),
+                extra_servicio_min=int(quote.extra_servicio_min or 0),
+            )
+            quote.horas_reales = None
+            for key, value in _campos_costos(costos).items():
                 setattr(quote, key, value)
-    except Exception as e:
-        print(f"Error recalculando pedido {qid}: {e}")
-        # No fallamos si el cálculo falla, al menos guardamos los cambios manuales
-    
+        except Exception as e:
+            print(f"Error recalculando costos del pedido {qid}: {e}")
+
     # 3) Sincronizar Calendario si está confirmado
     if quote.estado == "confirmado":
         # ¿Hubo cambio de fecha u hora?
@@ -1955,16 +3049,26 @@ def admin_patch_request(
             old_bookings = session.exec(statement_old).all()
             for ob in old_bookings:
                 session.delete(ob)
+            # Los DELETE antes del INSERT (si no, el índice único ve el mismo horario dos veces)
+            session.flush()
             
-            # Crear booking nuevo
+            # Crear booking nuevo (mismo chequeo de intervalos que /api/quote/send)
             if quote.fecha_turno and quote.hora_turno:
+                duracion = int(quote.tiempo_servicio_min or SLOT_MIN)
+                lock_dia(session, quote.fecha_turno)
+                if _booking_superpuesto(session, quote.fecha_turno, quote.hora_turno, duracion):
+                    session.rollback()
+                    raise HTTPException(status_code=409, detail="El trabajo se superpone con otra reserva de ese día")
                 new_b = dbBooking(
                     quote_id=str(quote.id),
                     date=quote.fecha_turno,
                     time=quote.hora_turno,
+                    duration_min=duracion,
                     status="confirmed"
                 )
                 session.add(new_b)
+        except HTTPException:
+            raise
         except Exception as e:
             print(f"Error sincronizando agenda en PATCH: {e}")
 
@@ -1973,11 +3077,15 @@ def admin_patch_request(
         quote.monto_estimado = body.monto_estimado
 
     session.add(quote)
-    _add_audit_log(session, qid, "UPDATE", f"Edición del pedido. Payload: {update_data}")
-    session.commit()
+    _add_audit_log(session, qid, "UPDATE", f"Edición del pedido (recálculo: {recalculo}). Payload: {update_data}")
+    try:
+        session.commit()
+    except IntegrityError:
+        session.rollback()
+        raise HTTPException(status_code=409, detail="Ese horario ya está reservado por otro pedido")
     session.refresh(quote)
 
-    return {"ok": True, "quote": _serialize_quote(quote)}
+    return {"ok": True, "quote": _serialize_quote(quote), "recalculo": recalculo}
 
 
 # ✅ 2) recién DESPUÉS tu catch-all para el SPA
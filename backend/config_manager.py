@@ -3,7 +3,11 @@ from typing import Dict, Any, List, Optional
 from sqlmodel import Session, select
 from .models.models import dbPricingConfig
 from datetime import datetime, timezone
+import hashlib
+import json
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 load_dotenv(override=True)
@@ -66,23 +70,81 @@ def get_default_env_config() -> dict:
         "MANTENIMIENTO_PCT": float(os.getenv("MANTENIMIENTO_PCT", "0.20")),
     }
 
+# Cada cuánto un worker revalida su snapshot contra la DB (solo lee updated_at)
+CONFIG_REVALIDATE_S = float(os.getenv("CONFIG_REVALIDATE_S", "5"))
+
+
+class _ConfigSnapshot:
+    __slots__ = ("values", "version", "updated_at", "checked_at", "marca")
+
+    def __init__(self, values: dict, version: int, updated_at: Optional[datetime]):
+        self.values = values
+        self.version = version
+        self.updated_at = updated_at
+        self.checked_at = time.monotonic()
+        # Igual en todos los workers para la misma config (version es un contador por proceso)
+        raw = json.dumps(values, sort_keys=True, default=str) + "|" + (updated_at.isoformat() if updated_at else "-")
+        self.marca = hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
 class DynamicConfig:
+    """
+    Variables de precio con snapshot en memoria por proceso.
+    - get_values: sin I/O mientras el snapshot es reciente; pasado CONFIG_REVALIDATE_S
+      revalida leyendo solo updated_at y recarga únicamente si cambió (otro worker guardó).
+    - update_values: guarda y publica un snapshot nuevo con version + 1.
+    """
+    _snapshot: Optional[_ConfigSnapshot] = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def _build(cls, config: Optional[dbPricingConfig]) -> dict:
+        defaults = get_default_env_config()
+        if config and config.config_data:
+            # Merge con lo que hay en DB
+            defaults.update({k: v for k, v in config.config_data.items() if k in defaults})
+        return defaults
+
+    @classmethod
+    def _publish(cls, values: dict, updated_at: Optional[datetime]) -> _ConfigSnapshot:
+        with cls._lock:
+            prev = cls._snapshot
+            snap = _ConfigSnapshot(values, (prev.version + 1) if prev else 1, updated_at)
+            cls._snapshot = snap
+        return snap
+
     @classmethod
     def get_values(cls, db_session: Session) -> dict:
-        """Lee la configuración desde la tabla PricingConfig."""
+        """Lee la configuración desde la tabla PricingConfig (vía snapshot)."""
+        snap = cls._snapshot
+        if snap and time.monotonic() - snap.checked_at < CONFIG_REVALIDATE_S:
+            return dict(snap.values)
         try:
             # En el refactor, db_session será el objeto Session de SQLModel
+            statement = select(dbPricingConfig.updated_at).where(dbPricingConfig.id == "pricing_vars")
+            updated_at = db_session.exec(statement).first()
+            if snap and updated_at == snap.updated_at:
+                snap.checked_at = time.monotonic()
+                return dict(snap.values)
+
             statement = select(dbPricingConfig).where(dbPricingConfig.id == "pricing_vars")
             config = db_session.exec(statement).first()
-            
-            defaults = get_default_env_config()
-            if config and config.config_data:
-                # Merge con lo que hay en DB
-                defaults.update({k: v for k, v in config.config_data.items() if k in defaults})
-            return defaults
+            snap = cls._publish(cls._build(config), config.updated_at if config else None)
+            return dict(snap.values)
         except Exception as e:
             print(f"Error reading dynamic config from SQL: {e}")
-            return get_default_env_config()
+            return dict(snap.values) if snap else get_default_env_config()
+
+    @classmethod
+    def marca(cls, db_session: Session) -> str:
+        """Identifica la config vigente (updated_at + valores): cambia si el admin la edita."""
+        cls.get_values(db_session)
+        snap = cls._snapshot
+        return snap.marca if snap else "env"
+
+    @classmethod
+    def version(cls) -> int:
+        return cls._snapshot.version if cls._snapshot else 0
 
     @classmethod
     def update_values(cls, db_session: Session, new_values: dict):
@@ -101,4 +163,5 @@ class DynamicConfig:
         
         db_session.commit()
         db_session.refresh(config)
+        cls._publish(cls._build(config), config.updated_at)
         return validated_data
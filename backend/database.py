@@ -1,4 +1,5 @@
 import os
+from sqlalchemy import text
 from sqlmodel import create_engine, SQLModel, Session
 from dotenv import load_dotenv
 
@@ -20,9 +21,48 @@ if DATABASE_URL.startswith("mysql://"):
 connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
 engine = create_engine(DATABASE_URL, connect_args=connect_args, echo=False)
 
+# Un solo booking activo por (date, time). Índice parcial: SQLite y Postgres lo soportan
+# con la misma sintaxis; en otros motores no se crea (quedaría bloqueando cancelados).
+BOOKING_SLOT_INDEX_SQL = (
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_bookings_slot_activo "
+    "ON bookings (date, time) WHERE status IN ('reserved', 'confirmed')"
+)
+
+# Listado del admin paginado por (created_at, id) descendente
+QUOTES_LISTADO_INDEX_SQL = (
+    "CREATE INDEX IF NOT EXISTS ix_quotes_listado ON quotes (is_deleted, created_at, id)"
+)
+
+def ensure_indexes():
+    if engine.dialect.name not in ("sqlite", "postgresql"):
+        return
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(BOOKING_SLOT_INDEX_SQL))
+    except Exception as e:
+        # Ej: bookings activos duplicados de antes del índice; hay que resolverlos a mano
+        print(f"[db] No se pudo crear uq_bookings_slot_activo: {e}")
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(QUOTES_LISTADO_INDEX_SQL))
+    except Exception as e:
+        print(f"[db] No se pudo crear ix_quotes_listado: {e}")
+
+def lock_dia(session: Session, fecha: str) -> None:
+    """
+    Serializa las reservas de un mismo día hasta el fin de la transacción (los bookings
+    son intervalos: el índice único solo ve el inicio). En Postgres es un advisory lock;
+    SQLite ya serializa a los escritores.
+    """
+    if engine.dialect.name == "postgresql":
+        session.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": int(fecha.replace("-", ""))})
+
 def init_db():
     from .models import models  # Importamos los modelos para registrarlos en SQLModel
     SQLModel.metadata.create_all(engine)
+    ensure_indexes()
+    from .search import ensure_search_index
+    ensure_search_index()
 
 def get_session():
     with Session(engine, expire_on_commit=False) as session:
@@ -0,0 +1,40 @@
+# backend/http_client.py
+"""
+Cliente HTTP compartido para los proveedores de ruteo (Google Maps / ORS).
+
+- Una sola requests.Session con pool de conexiones keep-alive: evita el
+  handshake TLS en cada llamada a maps.googleapis.com / openrouteservice.
+- Dos pools de threads para resolver en paralelo lo independiente:
+    * legs_pool: tramos de un presupuesto.
+    * geo_pool: geocodificaciones. Son tareas "hoja" (no encolan más trabajo),
+      así un tramo puede esperar sus geocodes sin riesgo de deadlock.
+
+Los endpoints son sync (corren en el threadpool de Starlette), por eso se usan
+threads y no un cliente async.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Any
+
+import requests
+from requests.adapters import HTTPAdapter
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+MAPS_WORKERS = int(os.getenv("MAPS_WORKERS", "8"))
+
+http = requests.Session()
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+http.mount("https://", _adapter)
+http.mount("http://", _adapter)
+
+legs_pool = ThreadPoolExecutor(max_workers=MAPS_WORKERS, thread_name_prefix="maps-leg")
+geo_pool = ThreadPoolExecutor(max_workers=MAPS_WORKERS, thread_name_prefix="maps-geo")
+
+
+def run_parallel(pool: ThreadPoolExecutor, tasks: List[Callable[[], Any]]) -> List[Any]:
+    """Ejecuta las tareas en el pool y devuelve los resultados en el mismo orden."""
+    if len(tasks) == 1:
+        return [tasks[0]()]
+    futures = [pool.submit(t) for t in tasks]
+    return [f.result() for f in futures]
@@ -0,0 +1,417 @@
+# backend/maps_cache.py
+"""
+Caché de resultados de Google Maps / ORS (y de los presupuestos del preview).
+
+Dos niveles:
+  1) LRU en memoria del proceso (lookup O(1), sin I/O).
+  2) Tabla SQL persistente con TTL y tope de filas (sobrevive reinicios y
+     se comparte entre workers).
+
+Las escrituras al SQL (altas, hits, vencidos) van a un único thread de fondo
+con su propia Session: el request nunca espera un lock de escritura (en SQLite
+el propio request puede tener la base tomada mientras rutea) ni se mezcla con
+su transacción.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from typing import Optional, Dict, Any
+
+from sqlalchemy import delete
+from sqlmodel import Session, select, func
+
+from .database import engine
+from .models.models import dbGeocodeCache, dbRouteCache
+
+
+def _as_utc(dt: Optional[datetime]) -> Optional[datetime]:
+    # SQLite devuelve datetimes naive (aunque los guardemos en UTC)
+    if dt is not None and dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="maps-cache-writer")
+
+
+def _en_segundo_plano(tag: str, fn, *args) -> None:
+    def run():
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f"[{tag}] Error escribiendo SQL: {e}")
+    _writer.submit(run)
+
+
+def flush() -> None:
+    """Espera a que terminen las escrituras pendientes (scripts / shutdown)."""
+    _writer.submit(lambda: None).result()
+
+
+def cache_key(addr: str) -> str:
+    """Clave canónica: minúsculas y espacios colapsados (la entrada ya viene de _normalize_addr)."""
+    return " ".join((addr or "").lower().split())
+
+
+class LRUCache:
+    """
+    LRU thread-safe. No cuenta hits/misses: cada caché cuenta el resultado de su lookup
+    después de validar TTL / hash (una entrada vencida presente en memoria no es un hit).
+    """
+
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = max(int(maxsize), 1)
+        self._data: "OrderedDict[Any, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                return self._data[key]
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            return self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class GeocodeCache:
+    """
+    Caché de geocodificación: dirección normalizada -> {"lat", "lng"}.
+    Solo guarda resultados exitosos; un fallo se vuelve a consultar la próxima vez.
+    """
+
+    def __init__(self):
+        self.mem = LRUCache(int(os.getenv("GEOCODE_CACHE_MAX_MEM", "512")))
+        self.ttl = timedelta(days=float(os.getenv("GEOCODE_CACHE_TTL_DAYS", "90")))
+        self.max_rows = int(os.getenv("GEOCODE_CACHE_MAX_ROWS", "5000"))
+        self.mem_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def get(self, addr: str) -> Optional[Dict[str, float]]:
+        key = cache_key(addr)
+        now = datetime.now(timezone.utc)
+        entry = self.mem.get(key)
+        if entry is not None:
+            # Mismo TTL que el nivel SQL: un worker con mucho tráfico no sirve coordenadas viejas
+            if now - entry["created_at"] <= self.ttl:
+                self.mem_hits += 1
+                return dict(entry["res"])
+            self.mem.pop(key)
+
+        val = created_at = None
+        try:
+            with Session(engine) as s:
+                row = s.get(dbGeocodeCache, key)
+                if row and now - _as_utc(row.created_at) <= self.ttl:
+                    val = {"lat": row.lat, "lng": row.lng}
+                    created_at = _as_utc(row.created_at)
+        except Exception as e:
+            print(f"[geocode_cache] Error leyendo SQL: {e}")
+        if val is not None:
+            _en_segundo_plano("geocode_cache", self._touch_sql, key)
+
+        if val is not None:
+            self.db_hits += 1
+            self.mem.put(key, {"created_at": created_at, "res": val})
+        else:
+            self.misses += 1
+        return val
+
+    def put(self, addr: str, val: Dict[str, float]) -> None:
+        key = cache_key(addr)
+        val = {"lat": float(val["lat"]), "lng": float(val["lng"])}
+        self.mem.put(key, {"created_at": datetime.now(timezone.utc), "res": val})
+        _en_segundo_plano("geocode_cache", self._put_sql, key, val)
+
+    @staticmethod
+    def _touch_sql(key: str) -> None:
+        with Session(engine) as s:
+            row = s.get(dbGeocodeCache, key)
+            if row:
+                row.hits = (row.hits or 0) + 1
+                row.last_used_at = datetime.now(timezone.utc)
+                s.add(row)
+                s.commit()
+
+    def _put_sql(self, key: str, val: Dict[str, float]) -> None:
+        with Session(engine) as s:
+            now = datetime.now(timezone.utc)
+            row = s.get(dbGeocodeCache, key)
+            if row:
+                row.lat, row.lng = val["lat"], val["lng"]
+                row.created_at = now
+                row.last_used_at = now
+            else:
+                row = dbGeocodeCache(key=key, lat=val["lat"], lng=val["lng"])
+            s.add(row)
+            s.commit()
+            self._evict(s)
+
+    def _evict(self, s: Session) -> None:
+        # 1) Vencidos por TTL
+        limite = datetime.now(timezone.utc) - self.ttl
+        res = s.execute(delete(dbGeocodeCache).where(dbGeocodeCache.created_at < limite))
+        n = res.rowcount or 0
+        # 2) Tope de tamaño: se van los menos usados recientemente
+        total = s.exec(select(func.count()).select_from(dbGeocodeCache)).one()
+        if total > self.max_rows:
+            viejos = s.exec(
+                select(dbGeocodeCache.key)
+                .order_by(dbGeocodeCache.last_used_at.asc())
+                .limit(total - self.max_rows)
+            ).all()
+            s.execute(delete(dbGeocodeCache).where(dbGeocodeCache.key.in_(viejos)))
+            for k in viejos:
+                self.mem.pop(k)
+            n += len(viejos)
+        if n:
+            self.evicted += n
+            s.commit()
+
+    def clear(self) -> int:
+        def run():
+            with Session(engine) as s:
+                res = s.execute(delete(dbGeocodeCache))
+                s.commit()
+                return res.rowcount or 0
+        self.mem.clear()
+        return _writer.submit(run).result()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.mem_hits + self.db_hits + self.misses
+        return {
+            "mem_hits": self.mem_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.mem_hits + self.db_hits) / lookups, 4) if lookups else 0.0,
+            "mem_size": len(self.mem),
+            "mem_max": self.mem.maxsize,
+            "evicted": self.evicted,
+        }
+
+
+class RouteCache:
+    """
+    Caché de tramos: (proveedor, origen, destino) -> {"dist_km", "tiempo_viaje_min"}.
+    Registra qué proveedor respondió (google / ors / fallback) y aplica un TTL
+    distinto por proveedor: la heurística de fallback vence rápido para volver
+    a intentar con la API real.
+    """
+
+    PROVIDERS = ("google", "ors", "fallback")
+
+    def __init__(self):
+        self.mem = LRUCache(int(os.getenv("ROUTE_CACHE_MAX_MEM", "1024")))
+        self.max_rows = int(os.getenv("ROUTE_CACHE_MAX_ROWS", "20000"))
+        self.ttls = {
+            "google": timedelta(hours=float(os.getenv("ROUTE_CACHE_TTL_GOOGLE_H", "720"))),
+            "ors": timedelta(hours=float(os.getenv("ROUTE_CACHE_TTL_ORS_H", "720"))),
+            "fallback": timedelta(hours=float(os.getenv("ROUTE_CACHE_TTL_FALLBACK_H", "1"))),
+        }
+        self.mem_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.by_provider = {p: 0 for p in self.PROVIDERS}
+
+    @staticmethod
+    def _key(provider: str, origen: str, destino: str) -> str:
+        return f"{provider}|{cache_key(origen)}|{cache_key(destino)}"
+
+    def get(self, provider: str, origen: str, destino: str) -> Optional[Dict[str, Any]]:
+        key = self._key(provider, origen, destino)
+        now = datetime.now(timezone.utc)
+        entry = self.mem.get(key)
+        if entry is not None:
+            if entry["expires_at"] > now:
+                self.mem_hits += 1
+                return dict(entry["res"])
+            self.mem.pop(key)
+
+        entry = None
+        try:
+            with Session(engine) as s:
+                row = s.get(dbRouteCache, key)
+                if row and _as_utc(row.expires_at) > now:
+                    entry = {
+                        "expires_at": _as_utc(row.expires_at),
+                        "res": {
+                            "dist_km": row.dist_km,
+                            "tiempo_viaje_min": int(row.tiempo_viaje_min),
+                            "provider_used": row.provider_used,
+                        },
+                    }
+        except Exception as e:
+            print(f"[route_cache] Error leyendo SQL: {e}")
+
+        if entry is None:
+            self.misses += 1
+            return None
+        self.db_hits += 1
+        self.mem.put(key, entry)
+        _en_segundo_plano("route_cache", self._touch_sql, key)
+        return dict(entry["res"])
+
+    def put(self, provider: str, origen: str, destino: str, res: Dict[str, Any], provider_used: str) -> None:
+        if provider_used not in self.ttls:
+            return
+        key = self._key(provider, origen, destino)
+        now = datetime.now(timezone.utc)
+        expires_at = now + self.ttls[provider_used]
+        val = {
+            "dist_km": float(res["dist_km"]),
+            "tiempo_viaje_min": int(res["tiempo_viaje_min"]),
+            "provider_used": provider_used,
+        }
+        self.mem.put(key, {"expires_at": expires_at, "res": val})
+        self.by_provider[provider_used] += 1
+        _en_segundo_plano(
+            "route_cache", self._put_sql,
+            key, provider, cache_key(origen), cache_key(destino), val, now, expires_at,
+        )
+
+    @staticmethod
+    def _touch_sql(key: str) -> None:
+        with Session(engine) as s:
+            row = s.get(dbRouteCache, key)
+            if row:
+                row.hits = (row.hits or 0) + 1
+                row.last_used_at = datetime.now(timezone.utc)
+                s.add(row)
+                s.commit()
+
+    def _put_sql(self, key, provider, origen, destino, val, now, expires_at) -> None:
+        with Session(engine) as s:
+            row = s.get(dbRouteCache, key) or dbRouteCache(
+                key=key, origen=origen, destino=destino,
+                provider=provider, provider_used=val["provider_used"],
+                dist_km=val["dist_km"], tiempo_viaje_min=val["tiempo_viaje_min"],
+                expires_at=expires_at,
+            )
+            row.provider_used = val["provider_used"]
+            row.dist_km = val["dist_km"]
+            row.tiempo_viaje_min = val["tiempo_viaje_min"]
+            row.created_at = now
+            row.last_used_at = now
+            row.expires_at = expires_at
+            s.add(row)
+            s.commit()
+            self._evict(s)
+
+    def _evict(self, s: Session) -> None:
+        res = s.execute(delete(dbRouteCache).where(dbRouteCache.expires_at < datetime.now(timezone.utc)))
+        n = res.rowcount or 0
+        total = s.exec(select(func.count()).select_from(dbRouteCache)).one()
+        if total > self.max_rows:
+            viejos = s.exec(
+                select(dbRouteCache.key)
+                .order_by(dbRouteCache.last_used_at.asc())
+                .limit(total - self.max_rows)
+            ).all()
+            s.execute(delete(dbRouteCache).where(dbRouteCache.key.in_(viejos)))
+            for k in viejos:
+                self.mem.pop(k)
+            n += len(viejos)
+        if n:
+            self.evicted += n
+            s.commit()
+
+    def invalidate(self, provider_used: Optional[str] = None) -> int:
+        """Borra todo el caché de tramos, o solo lo que respondió un proveedor dado."""
+        def run():
+            with Session(engine) as s:
+                stmt = delete(dbRouteCache)
+                if provider_used:
+                    stmt = stmt.where(dbRouteCache.provider_used == provider_used)
+                res = s.execute(stmt)
+                s.commit()
+                return res.rowcount or 0
+        self.mem.clear()
+        # Por el mismo thread de escritura: las altas encoladas antes no reaparecen después
+        return _writer.submit(run).result()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.mem_hits + self.db_hits + self.misses
+        return {
+            "mem_hits": self.mem_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.mem_hits + self.db_hits) / lookups, 4) if lookups else 0.0,
+            "mem_size": len(self.mem),
+            "mem_max": self.mem.maxsize,
+            "evicted": self.evicted,
+            "stored_by_provider": dict(self.by_provider),
+            "ttl_hours": {p: td.total_seconds() / 3600 for p, td in self.ttls.items()},
+        }
+
+
+class QuotePreviewCache:
+    """
+    Presupuestos calculados en /api/quote, guardados del lado del server hasta que el
+    cliente los envía: id opaco -> (hash de los inputs, campos calculados). El token del
+    preview lleva solo el id y el hash, nunca los costos internos.
+    Solo en memoria: si el send cae en otro worker (o el proceso reinició) es un miss y
+    se recalcula.
+    """
+
+    def __init__(self):
+        self.mem = LRUCache(int(os.getenv("QUOTE_PREVIEW_CACHE_MAX_MEM", "2048")))
+        self.mem_hits = 0
+        self.misses = 0
+
+    def get(self, key: str, hash_calculo: str) -> Optional[Dict[str, Any]]:
+        entry = self.mem.get(key)
+        if entry is not None and entry["expires_at"] <= datetime.now(timezone.utc):
+            self.mem.pop(key)
+            entry = None
+        # Inputs distintos a los del preview (o config nueva): no vale, pero queda para el original
+        if entry is None or entry["h"] != hash_calculo:
+            self.misses += 1
+            return None
+        self.mem_hits += 1
+        return dict(entry["res"])
+
+    def put(self, key: str, hash_calculo: str, res: Dict[str, Any], ttl_s: int) -> None:
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl_s)
+        self.mem.put(key, {"h": hash_calculo, "expires_at": expires_at, "res": dict(res)})
+
+    def clear(self) -> int:
+        n = len(self.mem)
+        self.mem.clear()
+        return n
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.mem_hits + self.misses
+        return {
+            "mem_hits": self.mem_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.mem_hits / lookups, 4) if lookups else 0.0,
+            "mem_size": len(self.mem),
+            "mem_max": self.mem.maxsize,
+        }
+
+
+geocode_cache = GeocodeCache()
+route_cache = RouteCache()
+quote_preview_cache = QuotePreviewCache()
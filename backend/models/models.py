@@ -1,6 +1,7 @@
 from datetime import datetime, timezone
 from typing import Optional, List, Dict
 from sqlmodel import SQLModel, Field, JSON
+from sqlalchemy import UniqueConstraint
 import uuid
 from enum import Enum
 
@@ -98,7 +99,8 @@ class dbBooking(SQLModel, table=True):
     __tablename__ = "bookings"
     id: Optional[int] = Field(default=None, primary_key=True)
     date: str = Field(index=True) # YYYY-MM-DD
-    time: str = Field(index=True) # HH:MM
+    time: str = Field(index=True) # HH:MM (inicio)
+    duration_min: int = Field(default=60) # Duración del servicio: el booking ocupa [time, time + duration_min)
     quote_id: Optional[str] = Field(default=None) # Guardamos como string por flexibilidad/compatibilidad
     status: str = Field(default="reserved") # reserved, confirmed, cancelled, completed
     confirmed_at: Optional[datetime] = None
@@ -123,6 +125,18 @@ class dbBlockRule(SQLModel, table=True):
     label: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class dbSlotHold(SQLModel, table=True):
+    __tablename__ = "slot_holds"
+    __table_args__ = (UniqueConstraint("date", "time", name="uq_slot_holds_slot"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    date: str = Field(index=True) # YYYY-MM-DD
+    time: str # HH:MM (inicio)
+    duration_min: int = Field(default=60) # Igual que un booking: el hold aparta [time, time + duration_min)
+    token: str = Field(index=True, unique=True)
+    client: Optional[str] = Field(default=None, index=True) # IP del cliente (tope de holds activos)
+    expires_at: datetime = Field(index=True)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
 class dbGlobalConfig(SQLModel, table=True):
     __tablename__ = "global_configs"
     id: str = Field(primary_key=True, default="global_config")
@@ -134,3 +148,26 @@ class dbPricingConfig(SQLModel, table=True):
     id: str = Field(primary_key=True, default="pricing_vars")
     config_data: Dict[str, float] = Field(default_factory=dict, sa_type=JSON)
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class dbGeocodeCache(SQLModel, table=True):
+    __tablename__ = "geocode_cache"
+    key: str = Field(primary_key=True) # Dirección normalizada (_normalize_addr + minúsculas)
+    lat: float
+    lng: float
+    hits: int = Field(default=0)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    last_used_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), index=True)
+
+class dbRouteCache(SQLModel, table=True):
+    __tablename__ = "route_cache"
+    key: str = Field(primary_key=True) # "<proveedor>|<origen>|<destino>" normalizados
+    origen: str
+    destino: str
+    provider: str = Field(index=True) # Proveedor configurado (ROUTING_PROVIDER)
+    provider_used: str = Field(index=True) # Quién respondió: google | ors | fallback
+    dist_km: float
+    tiempo_viaje_min: int
+    hits: int = Field(default=0)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    expires_at: datetime = Field(index=True)
+    last_used_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), index=True)
@@ -0,0 +1,273 @@
+# backend/pricing.py
+"""
+Cálculo de costos de un flete a partir de la configuración de precios.
+
+- costos_desde_conf: versión escalar (la que usa calcular_costos en cada presupuesto).
+- costos_batch: la misma fórmula con NumPy sobre columnas, para cotizar miles de
+  filas de una vez. Replica el orden de las operaciones de la versión escalar para
+  dar exactamente los mismos floats, y redondea igual (round de Python).
+- montos_batch / resumen_deltas: simulación "qué pasa si" de una configuración nueva
+  sobre los presupuestos guardados.
+"""
+
+import math
+from typing import Optional, Dict, List, Any
+
+import numpy as np
+
+
+# Claves del desglose, en el orden que devuelve costos_desde_conf
+CAMPOS_COSTOS = (
+    "horas_base", "tiempo_servicio_min", "costo_tiempo_base", "mantenimiento",
+    "costo_tiempo", "costo_combustible", "peajes_total", "viaticos",
+    "costo_ayudante", "costo_chofer_parcial", "costo_admin_parcial", "monto_estimado",
+)
+
+
+def costos_desde_conf(
+    conf: Dict[str, Any],
+    dist_km: float,
+    tiempo_viaje_min: int,
+    ayudante: bool,
+    horas_reales: Optional[float] = None,
+    peajes: int = 0,
+    viaticos: float = 0.0,
+    extra_servicio_min: int = 0,
+) -> Dict[str, float]:
+
+    
+    FACTOR_PONDERACION = conf.get("FACTOR_PONDERACION", 1.5)
+    COSTO_HORA = conf.get("COSTO_HORA", 0.0)
+    COSTO_HORA_AYUDANTE = conf.get("COSTO_HORA_AYUDANTE", 0.0)
+    COSTO_CHOFER_HORA = conf.get("COSTO_CHOFER_HORA", 0.0)
+    COSTO_ADMIN_HORA = conf.get("COSTO_ADMIN_HORA", 0.0)
+    KM_POR_LITRO = max(conf.get("KM_POR_LITRO", 8.0), 0.1)
+    COSTO_LITRO = conf.get("COSTO_LITRO", 0.0)
+    MANTENIMIENTO_PCT = conf.get("MANTENIMIENTO_PCT", 0.0)
+    COSTO_PEAJE = conf.get("COSTO_PEAJE", 0.0)
+    CARGA_DESC_H = conf.get("CARGA_DESC_H", 0.0)
+    BASE_FIJA = conf.get("BASE_FIJA", 0.0)
+    MIN_TOTAL = conf.get("MIN_TOTAL", 0.0)
+    REDONDEO_MIN = conf.get("REDONDEO_MIN", 0)
+    
+    # Flags de comportamiento
+    INCLUIR_CHOFER_ADMIN = conf.get("INCLUIR_CHOFER_ADMIN_EN_TOTAL", False)
+
+    # 2) Tiempo de viaje base (manejo)
+    # Si el tiempo es 0 o muy bajo, puede haber un error de API o velocidad 0
+    horas_manejo = (horas_reales if (horas_reales and horas_reales > 0) else (tiempo_viaje_min / 60.0))
+    if horas_manejo < 0.01 and dist_km > 0:
+        # Fallback de velocidad si algo falló (35km/h)
+        horas_manejo = dist_km / 35.0
+
+    # 3) Tiempo Total (Según Excel: (Manejo_Total * Ponderación) + Carga/Descarga)
+    # Ya no sumamos extra_servicio_min por fuera para evitar duplicación
+    tiempo_total_h = (horas_manejo * FACTOR_PONDERACION) + CARGA_DESC_H
+
+    # 4) Redondeo opcional
+    if REDONDEO_MIN > 0:
+        bloque_h = REDONDEO_MIN / 60.0
+        tiempo_total_h = bloque_h * math.ceil(tiempo_total_h / bloque_h)
+
+    # 5) Cálculos de costos basados en TIEMPO
+    costo_tiempo_base = tiempo_total_h * COSTO_HORA
+    
+    # Mantenimiento como % del costo de tiempo (Javier Excel: 20%)
+    pct_dec = MANTENIMIENTO_PCT / 100.0 if MANTENIMIENTO_PCT >= 1 else MANTENIMIENTO_PCT
+    mantenimiento = costo_tiempo_base * pct_dec
+    
+    # Ayudante (solo si el cliente lo pide)
+    costo_ayudante = (tiempo_total_h * COSTO_HORA_AYUDANTE) if ayudante else 0.0
+    
+    # Costos parciales internos (informativos)
+    costo_chofer = tiempo_total_h * COSTO_CHOFER_HORA
+    costo_admin = tiempo_total_h * COSTO_ADMIN_HORA
+
+    # 6) Cálculos de costos basados en DISTANCIA
+    costo_combustible = (dist_km / KM_POR_LITRO) * COSTO_LITRO
+    costo_peajes = peajes * COSTO_PEAJE
+    
+    costo_distancia_total = costo_combustible + costo_peajes + viaticos
+
+    # 7) MONTO TOTAL ESTIMADO
+    # Suma exacta de Javier: Costo Tiempo + Mantenimiento + Ayudante + Costo Distancia
+    monto_estimado = (
+        BASE_FIJA
+        + costo_tiempo_base
+        + mantenimiento
+        + costo_ayudante
+        + costo_distancia_total
+    )
+    
+    # Si el admin activó incluir costos internos en el precio al cliente
+    if INCLUIR_CHOFER_ADMIN:
+        monto_estimado += (costo_chofer + costo_admin)
+
+    monto_estimado = max(monto_estimado, MIN_TOTAL)
+
+    return {
+        "horas_base": round(tiempo_total_h, 2),
+        "tiempo_servicio_min": int(round(tiempo_total_h * 60)),
+        "costo_tiempo_base": round(costo_tiempo_base, 2),
+        "mantenimiento": round(mantenimiento, 2),
+        "costo_tiempo": round(costo_tiempo_base + mantenimiento + costo_ayudante, 2),
+        "costo_combustible": round(costo_combustible, 2),
+        "peajes_total": round(costo_peajes, 2),
+        "viaticos": round(viaticos, 2),
+        "costo_ayudante": round(costo_ayudante, 2),
+        "costo_chofer_parcial": round(costo_chofer, 2),
+        "costo_admin_parcial": round(costo_admin, 2),
+        "monto_estimado": round(monto_estimado, 2),
+    }
+
+
+def costos_batch(
+    conf: Dict[str, Any],
+    dist_km,
+    tiempo_viaje_min,
+    ayudante,
+    peajes,
+    viaticos,
+    horas_reales=None,
+) -> Dict[str, np.ndarray]:
+    """
+    Igual que costos_desde_conf pero sobre arrays (una posición por fila), sin redondear.
+    horas_reales: array opcional; NaN / <= 0 significa "no informado".
+    """
+    FACTOR_PONDERACION = conf.get("FACTOR_PONDERACION", 1.5)
+    COSTO_HORA = conf.get("COSTO_HORA", 0.0)
+    COSTO_HORA_AYUDANTE = conf.get("COSTO_HORA_AYUDANTE", 0.0)
+    COSTO_CHOFER_HORA = conf.get("COSTO_CHOFER_HORA", 0.0)
+    COSTO_ADMIN_HORA = conf.get("COSTO_ADMIN_HORA", 0.0)
+    KM_POR_LITRO = max(conf.get("KM_POR_LITRO", 8.0), 0.1)
+    COSTO_LITRO = conf.get("COSTO_LITRO", 0.0)
+    MANTENIMIENTO_PCT = conf.get("MANTENIMIENTO_PCT", 0.0)
+    COSTO_PEAJE = conf.get("COSTO_PEAJE", 0.0)
+    CARGA_DESC_H = conf.get("CARGA_DESC_H", 0.0)
+    BASE_FIJA = conf.get("BASE_FIJA", 0.0)
+    MIN_TOTAL = conf.get("MIN_TOTAL", 0.0)
+    REDONDEO_MIN = conf.get("REDONDEO_MIN", 0)
+    INCLUIR_CHOFER_ADMIN = conf.get("INCLUIR_CHOFER_ADMIN_EN_TOTAL", False)
+
+    dist_km = np.asarray(dist_km, dtype=np.float64)
+    tiempo_viaje_min = np.asarray(tiempo_viaje_min, dtype=np.float64)
+    ayudante = np.asarray(ayudante, dtype=bool)
+    peajes = np.asarray(peajes, dtype=np.float64)
+    viaticos = np.asarray(viaticos, dtype=np.float64)
+
+    # Tiempo de manejo (horas reales si vienen, si no el del ruteo; fallback 35 km/h)
+    horas_manejo = tiempo_viaje_min / 60.0
+    if horas_reales is not None:
+        hr = np.asarray(horas_reales, dtype=np.float64)
+        usar_hr = np.nan_to_num(hr, nan=0.0) > 0
+        horas_manejo = np.where(usar_hr, hr, horas_manejo)
+    horas_manejo = np.where((horas_manejo < 0.01) & (dist_km > 0), dist_km / 35.0, horas_manejo)
+
+    tiempo_total_h = (horas_manejo * FACTOR_PONDERACION) + CARGA_DESC_H
+    if REDONDEO_MIN > 0:
+        bloque_h = REDONDEO_MIN / 60.0
+        tiempo_total_h = bloque_h * np.ceil(tiempo_total_h / bloque_h)
+
+    costo_tiempo_base = tiempo_total_h * COSTO_HORA
+    pct_dec = MANTENIMIENTO_PCT / 100.0 if MANTENIMIENTO_PCT >= 1 else MANTENIMIENTO_PCT
+    mantenimiento = costo_tiempo_base * pct_dec
+    costo_ayudante = np.where(ayudante, tiempo_total_h * COSTO_HORA_AYUDANTE, 0.0)
+    costo_chofer = tiempo_total_h * COSTO_CHOFER_HORA
+    costo_admin = tiempo_total_h * COSTO_ADMIN_HORA
+
+    costo_combustible = (dist_km / KM_POR_LITRO) * COSTO_LITRO
+    costo_peajes = peajes * COSTO_PEAJE
+    costo_distancia_total = costo_combustible + costo_peajes + viaticos
+
+    monto_estimado = (
+        BASE_FIJA
+        + costo_tiempo_base
+        + mantenimiento
+        + costo_ayudante
+        + costo_distancia_total
+    )
+    if INCLUIR_CHOFER_ADMIN:
+        monto_estimado = monto_estimado + (costo_chofer + costo_admin)
+    monto_estimado = np.maximum(monto_estimado, MIN_TOTAL)
+
+    return {
+        "horas_base": tiempo_total_h,
+        "tiempo_servicio_min": np.rint(tiempo_total_h * 60),
+        "costo_tiempo_base": costo_tiempo_base,
+        "mantenimiento": mantenimiento,
+        "costo_tiempo": costo_tiempo_base + mantenimiento + costo_ayudante,
+        "costo_combustible": costo_combustible,
+        "peajes_total": costo_peajes,
+        "viaticos": viaticos,
+        "costo_ayudante": costo_ayudante,
+        "costo_chofer_parcial": costo_chofer,
+        "costo_admin_parcial": costo_admin,
+        "monto_estimado": monto_estimado,
+    }
+
+
+def _round2(a: np.ndarray) -> np.ndarray:
+    """
+    round(x, 2) de Python, vectorizado. k/100 con k entero es exactamente lo que devuelve
+    round(); solo cuando x*100 cae pegado a ,5 el producto puede cruzar el límite, y esas
+    posiciones (rarísimas) se resuelven con round() de Python.
+    """
+    esc = a * 100.0
+    r = np.round(esc) / 100.0
+    dudosos = np.abs(np.abs(esc - np.trunc(esc)) - 0.5) < 1e-6
+    if dudosos.any():
+        idx = np.nonzero(dudosos)[0]
+        r[idx] = [round(v, 2) for v in a[idx].tolist()]
+    return r
+
+
+def columnas_costos(cols: Dict[str, np.ndarray]) -> Dict[str, list]:
+    """Resultado de costos_batch redondeado igual que costos_desde_conf, como listas por columna."""
+    out = {}
+    for k in CAMPOS_COSTOS:
+        if k == "tiempo_servicio_min":
+            out[k] = cols[k].astype(np.int64).tolist()
+        else:
+            out[k] = _round2(np.asarray(cols[k], dtype=np.float64)).tolist()
+    return out
+
+
+def filas_costos(cols: Dict[str, np.ndarray]) -> List[Dict[str, float]]:
+    """Igual que columnas_costos pero en filas (un dict por fila, como calcular_costos)."""
+    listas = columnas_costos(cols)
+    return [dict(zip(CAMPOS_COSTOS, vals)) for vals in zip(*(listas[k] for k in CAMPOS_COSTOS))]
+
+
+def montos_batch(conf: Dict[str, Any], cols: Dict[str, Any]) -> np.ndarray:
+    """Solo el monto_estimado (redondeado) de cada fila, para comparar configuraciones."""
+    res = costos_batch(
+        conf,
+        dist_km=cols["dist_km"],
+        tiempo_viaje_min=cols["tiempo_viaje_min"],
+        ayudante=cols["ayudante"],
+        peajes=cols["peajes"],
+        viaticos=cols["viaticos"],
+        horas_reales=cols.get("horas_reales"),
+    )
+    return _round2(res["monto_estimado"])
+
+
+def resumen_deltas(antes: np.ndarray, despues: np.ndarray) -> Dict[str, Any]:
+    """Totales y conteos de la diferencia despues - antes (montos ya redondeados)."""
+    delta = despues - antes
+    total_antes = float(antes.sum())
+    total_despues = float(despues.sum())
+    n = int(antes.size)
+    return {
+        "count": n,
+        "total_actual": round(total_antes, 2),
+        "total_candidato": round(total_despues, 2),
+        "delta_total": round(total_despues - total_antes, 2),
+        "delta_pct": round((total_despues - total_antes) / total_antes * 100.0, 2) if total_antes else None,
+        "delta_promedio": round(float(delta.mean()), 2) if n else 0.0,
+        "delta_min": round(float(delta.min()), 2) if n else 0.0,
+        "delta_max": round(float(delta.max()), 2) if n else 0.0,
+        "suben": int((delta > 0.004).sum()),
+        "bajan": int((delta < -0.004).sum()),
+        "iguales": int((np.abs(delta) <= 0.004).sum()),
+    }
@@ -0,0 +1,117 @@
+# backend/scheduler.py
+"""
+Tareas periódicas de mantenimiento dentro del proceso (un scheduler por worker).
+
+- Un solo thread daemon despierta cada SCHEDULER_TICK_S y corre las tareas vencidas,
+  de a una: cada tarea corre como mucho una vez por su intervalo.
+- Las tareas tienen que ser idempotentes (UPDATE/DELETE por conjunto): con varios
+  workers cada uno tiene su scheduler y la misma tarea puede correr en paralelo.
+- Un error en una tarea se registra y no frena al resto (se reintenta en el próximo intervalo).
+"""
+
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1") == "1"
+SCHEDULER_TICK_S = float(os.getenv("SCHEDULER_TICK_S", "5"))
+
+
+class _Tarea:
+    def __init__(self, name: str, fn: Callable[[], Optional[int]], interval_s: float):
+        self.name = name
+        self.fn = fn
+        self.interval_s = interval_s
+        self.proxima = 0.0          # monotonic; 0 = corre en el primer tick
+        self.corridas = 0
+        self.errores = 0
+        self.ultimo_resultado: Optional[int] = None
+        self.ultimo_error: Optional[str] = None
+        self.ultima_duracion_ms: Optional[float] = None
+        self.ultima_corrida: Optional[float] = None  # epoch
+
+
+class JobScheduler:
+    def __init__(self, tick_s: float = SCHEDULER_TICK_S):
+        self.tick_s = tick_s
+        self._tareas: Dict[str, _Tarea] = {}
+        self._lock = threading.Lock()      # una tarea a la vez (tick o run_now)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def every(self, interval_s: float, name: Optional[str] = None):
+        """Decorador: registra fn() como tarea cada interval_s segundos. fn puede devolver un conteo."""
+        def deco(fn):
+            self._tareas[name or fn.__name__] = _Tarea(name or fn.__name__, fn, interval_s)
+            return fn
+        return deco
+
+    def _correr(self, t: _Tarea) -> None:
+        t0 = time.perf_counter()
+        try:
+            t.ultimo_resultado = t.fn()
+            t.ultimo_error = None
+        except Exception as e:
+            t.errores += 1
+            t.ultimo_error = str(e)[:200]
+            print(f"[scheduler] {t.name} falló: {e}")
+        t.corridas += 1
+        t.ultima_duracion_ms = round((time.perf_counter() - t0) * 1000, 2)
+        t.ultima_corrida = time.time()
+        t.proxima = time.monotonic() + t.interval_s
+
+    def tick(self) -> None:
+        """Corre las tareas vencidas (lo llama el thread; también sirve para tests)."""
+        ahora = time.monotonic()
+        for t in list(self._tareas.values()):
+            if ahora >= t.proxima:
+                with self._lock:
+                    self._correr(t)
+
+    def run_now(self, name: str) -> bool:
+        t = self._tareas.get(name)
+        if not t:
+            return False
+        with self._lock:
+            self._correr(t)
+        return True
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            self.tick()
+            self._stop.wait(self.tick_s)
+
+    def start(self) -> None:
+        if not SCHEDULER_ENABLED or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.tick_s + 1)
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "running": bool(self._thread and self._thread.is_alive()),
+            "tick_s": self.tick_s,
+            "jobs": {
+                t.name: {
+                    "interval_s": t.interval_s,
+                    "runs": t.corridas,
+                    "errors": t.errores,
+                    "last_result": t.ultimo_resultado,
+                    "last_error": t.ultimo_error,
+                    "last_duration_ms": t.ultima_duracion_ms,
+                    "last_run_at": t.ultima_corrida,
+                }
+                for t in self._tareas.values()
+            },
+        }
+
+
+scheduler = JobScheduler()
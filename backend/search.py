@@ -0,0 +1,177 @@
+# backend/search.py
+"""
+Búsqueda de presupuestos por texto (nombre, teléfono, origen, destino, tipo de carga).
+
+- Índice de trigramas en los dos motores, así "4567" encuentra "351 123-4567" y
+  "ortiz" encuentra "Av. Ortiz de Ocampo" (substring, no solo prefijo):
+    * SQLite: tabla FTS5 quotes_fts (tokenizer trigram) mantenida por triggers.
+    * Postgres: índice GIN pg_trgm sobre una expresión que concatena las columnas.
+- El teléfono se indexa (y se compara en el ILIKE) solo con dígitos; los términos "tipo
+  teléfono" se normalizan igual.
+- Términos de menos de 3 caracteres (o motores sin índice) van por ILIKE.
+"""
+
+import re
+from typing import List, Optional
+
+from sqlalchemy import and_, func, or_, text
+
+from .database import engine
+from .models.models import dbQuote
+
+BUSQUEDA_MIN_TRIGRAMA = 3
+_TELEFONO_RE = re.compile(r"[\d\s\-\+\(\)\./]+")
+_NO_DIGITO_RE = re.compile(r"\D")
+
+# ---- SQLite (FTS5) ----
+# Sin regexp en SQLite: los separadores habituales de un teléfono se sacan con replace()
+_SEPARADORES_TEL = [" ", "-", "+", "(", ")", ".", "/"]
+
+
+def _sql_digitos(col: str) -> str:
+    expr = f"coalesce({col}, '')"
+    for sep in _SEPARADORES_TEL:
+        expr = f"replace({expr}, '{sep}', '')"
+    return expr
+
+
+_FTS_COLS = "nombre_cliente, telefono, origen, destino, tipo_carga"
+
+
+def _fts_valores(fila: str) -> str:
+    return (
+        f"{fila}.id, {fila}.nombre_cliente, {_sql_digitos(fila + '.telefono')}, "
+        f"{fila}.origen, {fila}.destino, {fila}.tipo_carga"
+    )
+
+
+SQLITE_FTS_SQL = [
+    f"""CREATE TRIGGER IF NOT EXISTS quotes_fts_ai AFTER INSERT ON quotes BEGIN
+        INSERT INTO quotes_fts(rowid, {_FTS_COLS}) VALUES ({_fts_valores('new')});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS quotes_fts_ad AFTER DELETE ON quotes BEGIN
+        DELETE FROM quotes_fts WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS quotes_fts_au
+        AFTER UPDATE OF nombre_cliente, telefono, origen, destino, tipo_carga ON quotes BEGIN
+        DELETE FROM quotes_fts WHERE rowid = old.id;
+        INSERT INTO quotes_fts(rowid, {_FTS_COLS}) VALUES ({_fts_valores('new')});
+    END""",
+]
+
+# ---- Postgres (pg_trgm) ----
+# La consulta tiene que usar EXACTAMENTE esta expresión para que el planner use el índice
+PG_BUSQUEDA_EXPR = (
+    "lower(coalesce(nombre_cliente, '') || ' ' || "
+    "regexp_replace(coalesce(telefono, ''), '[^0-9]', '', 'g') || ' ' || "
+    "coalesce(origen, '') || ' ' || coalesce(destino, '') || ' ' || coalesce(tipo_carga, ''))"
+)
+PG_TRGM_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_quotes_busqueda_trgm ON quotes USING gin (({PG_BUSQUEDA_EXPR}) gin_trgm_ops)",
+]
+
+# Se decide en ensure_search_index (None = sin índice: todo por ILIKE)
+_modo: Optional[str] = None
+
+
+def digitos(s: Optional[str]) -> str:
+    return _NO_DIGITO_RE.sub("", s or "")
+
+
+def _crear_fts(conn) -> None:
+    existe = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'quotes_fts'")).first()
+    if not existe:
+        try:
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE quotes_fts USING fts5({_FTS_COLS}, tokenize='trigram remove_diacritics 1')"
+            ))
+        except Exception:
+            # SQLite < 3.45: trigram sin remove_diacritics
+            conn.execute(text(f"CREATE VIRTUAL TABLE quotes_fts USING fts5({_FTS_COLS}, tokenize='trigram')"))
+    for sql in SQLITE_FTS_SQL:
+        conn.execute(text(sql))
+    # Backfill / reparación (filas de antes del índice o cargadas con los triggers ausentes)
+    n_q = conn.execute(text("SELECT count(*) FROM quotes")).scalar()
+    n_f = conn.execute(text("SELECT count(*) FROM quotes_fts")).scalar()
+    if n_q != n_f:
+        conn.execute(text("DELETE FROM quotes_fts"))
+        conn.execute(text(f"INSERT INTO quotes_fts(rowid, {_FTS_COLS}) SELECT {_fts_valores('quotes')} FROM quotes"))
+
+
+def ensure_search_index() -> None:
+    global _modo
+    dialecto = engine.dialect.name
+    try:
+        with engine.begin() as conn:
+            if dialecto == "sqlite":
+                _crear_fts(conn)
+                _modo = "fts5"
+            elif dialecto == "postgresql":
+                for sql in PG_TRGM_SQL:
+                    conn.execute(text(sql))
+                _modo = "trgm"
+    except Exception as e:
+        # Ej: SQLite sin FTS5 o Postgres sin permiso para CREATE EXTENSION
+        _modo = None
+        print(f"[db] Búsqueda sin índice de texto ({dialecto}): {e}")
+
+
+def _terminos(q: str) -> List[str]:
+    """Términos de la búsqueda; los que parecen teléfono quedan solo con dígitos."""
+    q = q.strip()
+    if any(ch.isdigit() for ch in q) and _TELEFONO_RE.fullmatch(q):
+        return [digitos(q)]  # "351 15-555 1234" es UN teléfono, no cuatro términos
+    out = []
+    for t in q.split():
+        if any(ch.isdigit() for ch in t) and _TELEFONO_RE.fullmatch(t):
+            t = digitos(t)
+        if t:
+            out.append(t)
+    return out
+
+
+def _escapar_like(t: str) -> str:
+    return t.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _telefono_digitos():
+    """telefono sin separadores, igual que en los índices (replace() anidados: anda en los dos motores)."""
+    expr = func.coalesce(dbQuote.telefono, "")
+    for sep in _SEPARADORES_TEL:
+        expr = func.replace(expr, sep, "")
+    return expr
+
+
+def _ilike(t: str):
+    patron = f"%{_escapar_like(t)}%"
+    return or_(*(
+        col.ilike(patron, escape="\\")
+        for col in (dbQuote.nombre_cliente, _telefono_digitos(), dbQuote.origen, dbQuote.destino, dbQuote.tipo_carga)
+    ))
+
+
+def condicion_busqueda(q: Optional[str]):
+    """
+    Condición WHERE sobre quotes para el texto q (todos los términos tienen que aparecer).
+    None si q no tiene términos.
+    """
+    terminos = _terminos(q or "")
+    if not terminos:
+        return None
+    indexables = [t for t in terminos if len(t) >= BUSQUEDA_MIN_TRIGRAMA] if _modo else []
+    condiciones = [_ilike(t) for t in terminos if t not in indexables]
+
+    if indexables and _modo == "fts5":
+        match = " AND ".join('"' + t.replace('"', '""') + '"' for t in indexables)
+        condiciones.append(dbQuote.id.in_(
+            text("SELECT rowid FROM quotes_fts WHERE quotes_fts MATCH :fts_match").bindparams(fts_match=match)
+        ))
+    elif indexables and _modo == "trgm":
+        for i, t in enumerate(indexables):
+            condiciones.append(
+                text(f"{PG_BUSQUEDA_EXPR} LIKE :trgm_{i} ESCAPE '\\'").bindparams(
+                    **{f"trgm_{i}": f"%{_escapar_like(t.lower())}%"}
+                )
+            )
+    return and_(*condiciones)
@@ -0,0 +1,142 @@
+# backend/sse.py
+"""
+Canal Server-Sent Events de la agenda (un hub por worker).
+
+- publish() se llama desde cualquier thread (endpoints sync, writer de fondo):
+  serializa el evento UNA vez y lo reparte en el event loop a la cola de cada cliente.
+- Cada conexión es una tarea async esperando su cola: miles de clientes ociosos
+  cuestan una cola y un heartbeat cada SSE_HEARTBEAT_S, sin threads.
+- Historial corto por id: un cliente que reconecta con Last-Event-ID recibe lo que
+  se perdió; si ya no está en el historial (o su cola se llenó) recibe "reload".
+- Cada cliente escucha para una cantidad de slots (la duración de su trabajo). Un cambio de
+  agenda se publica con una variante por cantidad (mismo id); quien no tiene la suya, en
+  vivo o al reconectar con Last-Event-ID, recibe "reload".
+"""
+
+import asyncio
+import json
+import os
+import threading
+from collections import deque
+from typing import AsyncIterator, Dict, Optional, Set
+
+SSE_HEARTBEAT_S = float(os.getenv("SSE_HEARTBEAT_S", "15"))
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "64"))
+SSE_HISTORY = int(os.getenv("SSE_HISTORY", "256"))
+
+_RELOAD = b"event: reload\ndata: {}\n\n"
+
+
+def _formatear(event_id: int, event: str, data: dict) -> bytes:
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n".encode("utf-8")
+
+
+class SlotEvents:
+    def __init__(self):
+        self._clientes: Dict[asyncio.Queue, int] = {}       # cola -> n_slots (solo se toca con _lock)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._historial: deque = deque(maxlen=SSE_HISTORY)   # (id, {n_slots | None: bytes})
+        self._ultimo_id = 0
+        self._lock = threading.Lock()
+        self.publicados = 0
+        self.descartados = 0
+
+    def clientes(self) -> int:
+        with self._lock:
+            return len(self._clientes)
+
+    def slots_escuchados(self) -> Set[int]:
+        """Cantidades de slots con al menos un cliente conectado."""
+        with self._lock:
+            return set(self._clientes.values())
+
+    def publish(self, event: str, data: dict) -> None:
+        """Thread-safe. Para todos los clientes. Siempre queda en el historial (para quien reconecte)."""
+        self._publicar(lambda i: {None: _formatear(i, event, data)})
+
+    def publish_por_slots(self, event: str, datos: Dict[int, dict]) -> None:
+        """
+        Thread-safe. Un mismo cambio armado para cada cantidad de slots ({n_slots: data}), con un
+        solo id. El cliente cuya cantidad no está recibe "reload" (en vivo o al reconectar).
+        """
+        self._publicar(lambda i: {n: _formatear(i, event, d) for n, d in datos.items()})
+
+    def _publicar(self, armar) -> None:
+        with self._lock:
+            self._ultimo_id += 1
+            msgs = armar(self._ultimo_id)
+            self._historial.append((self._ultimo_id, msgs))
+            hay_clientes = bool(self._clientes)
+        self.publicados += 1
+        loop = self._loop
+        if loop is None or not hay_clientes:
+            return
+        try:
+            loop.call_soon_threadsafe(self._repartir, msgs)
+        except RuntimeError:
+            pass  # loop cerrado (shutdown)
+
+    @staticmethod
+    def _variante(msgs: dict, n_slots: int) -> bytes:
+        return msgs.get(None) or msgs.get(n_slots) or _RELOAD
+
+    def _repartir(self, msgs: dict) -> None:
+        with self._lock:
+            clientes = list(self._clientes.items())
+        for q, n in clientes:
+            try:
+                q.put_nowait(self._variante(msgs, n))
+            except asyncio.QueueFull:
+                # Cliente lento: se vacía su cola y se le pide recargar
+                self.descartados += 1
+                while not q.empty():
+                    q.get_nowait()
+                q.put_nowait(_RELOAD)
+
+    def _pendientes(self, last_event_id: Optional[str], n_slots: int) -> list:
+        try:
+            desde = int(last_event_id)
+        except (TypeError, ValueError):
+            return []
+        with self._lock:
+            hist = list(self._historial)
+            ultimo = self._ultimo_id
+        if desde >= ultimo:
+            return []
+        if not hist or hist[0][0] > desde + 1:
+            return [_RELOAD]
+        pendientes = [self._variante(msgs, n_slots) for i, msgs in hist if i > desde]
+        # Un cambio que no se armó para esta duración: el hueco no se puede completar
+        return [_RELOAD] if _RELOAD in pendientes else pendientes
+
+    async def stream(self, request, last_event_id: Optional[str] = None, n_slots: int = 1) -> AsyncIterator[bytes]:
+        self._loop = asyncio.get_running_loop()
+        q: asyncio.Queue = asyncio.Queue(maxsize=SSE_QUEUE_SIZE)
+        with self._lock:
+            self._clientes[q] = n_slots
+        try:
+            yield b"retry: 5000\n\n"
+            for m in self._pendientes(last_event_id, n_slots):
+                yield m
+            while True:
+                try:
+                    yield await asyncio.wait_for(q.get(), timeout=SSE_HEARTBEAT_S)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield b": ping\n\n"
+        finally:
+            with self._lock:
+                self._clientes.pop(q, None)
+
+    def stats(self) -> dict:
+        return {
+            "clientes": self.clientes(),
+            "publicados": self.publicados,
+            "descartados": self.descartados,
+            "ultimo_id": self._ultimo_id,
+        }
+
+
+slot_events = SlotEvents()
@@ -42,7 +42,7 @@ MODEL_FIELDS = {
         "failed_logins", "lock_until", "mongo_id", "created_at", "updated_at"
     ],
     "bookings": [
-        "id", "date", "time", "quote_id", "status", "confirmed_at", "created_at"
+        "id", "date", "time", "duration_min", "quote_id", "status", "confirmed_at", "created_at"
     ],
     "availability_overrides": [
         "id", "date", "enabled", "slots", "updated_at"
@@ -60,6 +60,16 @@ MODEL_FIELDS = {
     "audit_logs": [
         "id", "quote_id", "action", "details", "admin_user", "created_at"
     ],
+    "geocode_cache": [
+        "key", "lat", "lng", "hits", "created_at", "last_used_at"
+    ],
+    "route_cache": [
+        "key", "origen", "destino", "provider", "provider_used", "dist_km",
+        "tiempo_viaje_min", "hits", "created_at", "expires_at", "last_used_at"
+    ],
+    "slot_holds": [
+        "id", "date", "time", "duration_min", "token", "client", "expires_at", "created_at"
+    ],
 }
 
 def check_table(table_name):
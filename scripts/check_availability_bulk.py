@@ -0,0 +1,94 @@
+"""
+/api/availability/bulk y /api/availability/day aplican la misma regla: los horarios que ocupa
+una reserva activa se conservan en el override y se informan en "bloqueados", tomando el
+intervalo completo del booking (time + duration_min) y no solo su inicio.
+
+Usa una base SQLite temporal; no llama APIs externas.
+
+Ejecutar: python scripts/check_availability_bulk.py
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/availability_bulk.db"
+os.environ["ADMIN_API_KEY"] = "check-availability-bulk"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+import backend.backend as B
+from backend.models.models import dbAvailabilityOverride, dbBooking
+
+HEADERS = {"X-API-Key": os.environ["ADMIN_API_KEY"]}
+
+
+def main():
+    ok = True
+
+    def check(nombre, cond):
+        nonlocal ok
+        ok = ok and bool(cond)
+        print(f"  [{'OK' if cond else 'ERR'}] {nombre}")
+
+    fecha = (datetime.now(timezone(timedelta(hours=-3))).date() + timedelta(days=30)).isoformat()
+    sin_10 = [s for s in B.DEFAULT_SLOTS if s != "10:00"]
+
+    with TestClient(B.app) as c:
+        # Trabajo de 120 min a las 09:00: ocupa 09:00 y 10:00
+        with Session(B.engine) as s:
+            s.add(dbBooking(quote_id="check", date=fecha, time="09:00", duration_min=120, status="reserved"))
+            s.commit()
+
+        def bulk(days):
+            return c.post("/api/availability/bulk", json={"days": days}, headers=HEADERS)
+
+        def override():
+            with Session(B.engine) as s:
+                return s.exec(select(dbAvailabilityOverride).where(dbAvailabilityOverride.date == fecha)).first()
+
+        print("=== BOOKING 09:00 + 120 min ===")
+        r = c.get("/api/admin/bookings/day", params={"date": fecha}, headers=HEADERS)
+        dia = r.json()
+        check(f"bookings/day bloquea todo el intervalo {dia.get('ocupados')}", dia.get("ocupados") == ["09:00", "10:00"])
+        reserva = (dia.get("reservas") or [{}])[0]
+        check("bookings/day informa duración y fin",
+              reserva.get("duration_min") == 120 and reserva.get("fin") == "11:00")
+
+        r = bulk([{"date": fecha, "enabled": True, "slots": sin_10}])
+        check(f"bulk: quitar 10:00 (dentro del intervalo) -> 200 ({r.status_code})", r.status_code == 200)
+        check(f"bulk informa lo bloqueado {r.json().get('bloqueados')}",
+              r.json().get("bloqueados") == {fecha: ["09:00", "10:00"]})
+        guardado = override()
+        check("bulk conserva 09:00 y 10:00", guardado and {"09:00", "10:00"} <= set(guardado.slots))
+
+        r = c.post("/api/availability/day", json={"date": fecha, "enabled": True, "slots": sin_10}, headers=HEADERS)
+        check(f"day: quitar 10:00 -> 200 ({r.status_code})", r.status_code == 200)
+        check("day informa lo bloqueado", r.json().get("bloqueados") == ["09:00", "10:00"])
+        check("day guarda lo mismo que bulk", set(override().slots) == set(guardado.slots))
+
+        r = bulk([{"date": fecha, "enabled": True, "slots": [s for s in B.DEFAULT_SLOTS if s != "11:00"]}])
+        check(f"quitar 11:00 (fuera del intervalo) -> 200 ({r.status_code})", r.status_code == 200)
+        check("11:00 sí se quita", "11:00" not in override().slots)
+
+        r = bulk([{"date": fecha, "enabled": False, "slots": []}])
+        check(f"deshabilitar el día -> 200 ({r.status_code})", r.status_code == 200)
+        check("deshabilitado informa lo bloqueado", r.json().get("bloqueados") == {fecha: ["09:00", "10:00"]})
+
+        with Session(B.engine) as s:
+            b = s.exec(select(dbBooking).where(dbBooking.date == fecha)).first()
+            b.status = "cancelled"
+            s.add(b)
+            s.commit()
+        r = bulk([{"date": fecha, "enabled": True, "slots": sin_10}])
+        check(f"booking cancelado: quitar 10:00 -> 200 ({r.status_code})", r.status_code == 200)
+        check("sin reservas: 10:00 se quita", "10:00" not in override().slots and not r.json()["bloqueados"])
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
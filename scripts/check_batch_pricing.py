@@ -0,0 +1,111 @@
+"""
+Paridad y benchmark de la cotización batch (NumPy) contra calcular_costos (escalar).
+No toca la base de datos ni APIs externas.
+
+Ejecutar: python scripts/check_batch_pricing.py [filas]
+"""
+import os
+import sys
+import random
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.config_manager import get_default_env_config
+from backend.pricing import costos_desde_conf, costos_batch, filas_costos, columnas_costos, CAMPOS_COSTOS
+
+
+def configs_de_prueba():
+    base = get_default_env_config()
+    yield "default", base
+    yield "sin_redondeo", {**base, "REDONDEO_MIN": 0}
+    yield "redondeo_15_min_total", {**base, "REDONDEO_MIN": 15, "MIN_TOTAL": 40000.0, "BASE_FIJA": 5000.0}
+    yield "chofer_admin_en_total", {**base, "INCLUIR_CHOFER_ADMIN_EN_TOTAL": True, "MANTENIMIENTO_PCT": 20.0}
+    yield "carga_desc", {**base, "CARGA_DESC_H": 1.5, "FACTOR_PONDERACION": 1.0}
+
+
+def filas_random(n, seed=1234):
+    rnd = random.Random(seed)
+    filas = []
+    for i in range(n):
+        filas.append({
+            "dist_km": round(rnd.uniform(0, 250), 3) if i % 17 else 0.0,
+            "tiempo_viaje_min": rnd.randint(0, 300) if i % 13 else 0,
+            "ayudante": rnd.random() < 0.4,
+            "peajes": rnd.randint(0, 4),
+            "viaticos": round(rnd.uniform(0, 20000), 2) if rnd.random() < 0.3 else 0.0,
+            "horas_reales": round(rnd.uniform(0.5, 9), 2) if rnd.random() < 0.1 else None,
+        })
+    return filas
+
+
+def filas_borde():
+    # Valores "x,xx5" que en binario quedan a un pelo de la mitad (el caso clásico 2.675)
+    return [
+        {"dist_km": v, "tiempo_viaje_min": 30, "ayudante": False, "peajes": 0, "viaticos": v, "horas_reales": None}
+        for v in (0.005, 0.015, 0.125, 0.285, 1.005, 1.115, 2.675, 10.245, 1234.565, 99999.995)
+    ]
+
+
+def batch_cols(conf, filas):
+    return costos_batch(
+        conf,
+        dist_km=[f["dist_km"] for f in filas],
+        tiempo_viaje_min=[f["tiempo_viaje_min"] for f in filas],
+        ayudante=[f["ayudante"] for f in filas],
+        peajes=[f["peajes"] for f in filas],
+        viaticos=[f["viaticos"] for f in filas],
+        horas_reales=[f["horas_reales"] if f["horas_reales"] is not None else float("nan") for f in filas],
+    )
+
+
+def batch(conf, filas):
+    return filas_costos(batch_cols(conf, filas))
+
+
+def escalar(conf, filas):
+    return [
+        costos_desde_conf(conf, f["dist_km"], f["tiempo_viaje_min"], f["ayudante"],
+                          horas_reales=f["horas_reales"], peajes=f["peajes"], viaticos=f["viaticos"])
+        for f in filas
+    ]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    filas = filas_random(n)
+    ok = True
+
+    print(f"=== PARIDAD ({n} filas) ===")
+    for nombre, conf in configs_de_prueba():
+        a = escalar(conf, filas)
+        b = batch(conf, filas)
+        difs = [(i, k, a[i][k], b[i][k]) for i in range(n) for k in CAMPOS_COSTOS if a[i][k] != b[i][k]]
+        if difs:
+            ok = False
+            print(f"  [ERR] {nombre}: {len(difs)} diferencias, ej: {difs[:3]}")
+        else:
+            print(f"  [OK] {nombre}")
+
+    conf = {**get_default_env_config(), "KM_POR_LITRO": 1.0, "COSTO_LITRO": 1.0}
+    bordes = filas_borde()
+    if escalar(conf, bordes) != batch(conf, bordes):
+        ok = False
+        print("  [ERR] redondeo en valores borde")
+    else:
+        print("  [OK] redondeo en valores borde")
+
+    print(f"\n=== BENCHMARK ({n} filas, config default) ===")
+    conf = get_default_env_config()
+    t0 = time.perf_counter(); escalar(conf, filas); t_esc = time.perf_counter() - t0
+    t0 = time.perf_counter(); batch(conf, filas); t_bat = time.perf_counter() - t0
+    print(f"  escalar: {t_esc:.3f}s ({n / t_esc:,.0f} filas/s)")
+    print(f"  batch:   {t_bat:.3f}s ({n / t_bat:,.0f} filas/s)  x{t_esc / t_bat:.1f}")
+    t0 = time.perf_counter(); columnas_costos(batch_cols(conf, filas)); t_col = time.perf_counter() - t0
+    print(f"  batch (columnas): {t_col:.3f}s ({n / t_col:,.0f} filas/s)  x{t_esc / t_col:.1f}")
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+El quote_token del preview no tiene que filtrar costos internos: se decodifica el token
+(sin verificar la firma, como lo haría cualquiera desde devtools) y ninguno de los campos
+que _quote_public no expone puede aparecer. Además, el send con el token persiste lo mismo
+que calculó el preview y un token con inputs cambiados se ignora.
+
+Usa una base SQLite temporal y ruteo heurístico (sin APIs externas).
+
+Ejecutar: python scripts/check_quote_token.py
+"""
+import base64
+import json
+import os
+import sys
+import tempfile
+import zlib
+
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/quote_token.db"
+os.environ["GOOGLE_MAPS_API_KEY"] = ""
+os.environ["ORS_API_KEY"] = ""
+os.environ["JWT_SECRET"] = "check-quote-token-secret"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+import backend.backend as B
+from backend.models.models import dbQuote
+
+
+def decodificar(token: str) -> str:
+    """Payload de un token de itsdangerous tal cual: base64 (y zlib si empieza con '.')."""
+    payload = token.rsplit(".", 2)[0]
+    comprimido = payload.startswith(".")
+    payload = payload.lstrip(".")
+    raw = base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4))
+    return (zlib.decompress(raw) if comprimido else raw).decode("utf-8")
+
+
+def main():
+    ok = True
+
+    def check(nombre, cond):
+        nonlocal ok
+        ok = ok and bool(cond)
+        print(f"  [{'OK' if cond else 'ERR'}] {nombre}")
+
+    body = {
+        "nombre": "Check Token", "telefono": "3510000000",
+        "origen": "Calle 1 100", "destino": "Calle 2 200",
+        "ayudante": True, "peajes": 2, "accepted_terms": True,
+    }
+
+    with TestClient(B.app) as c:
+        B.limiter.enabled = False
+
+        print("=== PREVIEW ===")
+        r = c.post("/api/quote", json=body)
+        check("preview 200", r.status_code == 200)
+        res = r.json()
+        token = res.get("quote_token")
+        check("devuelve quote_token", bool(token))
+
+        texto = decodificar(token)
+        payload = json.loads(texto)
+        publicos = set(res["quote"])
+        internos = sorted(set(dbQuote.model_fields) - publicos)
+        filtrados = [k for k in internos if k in texto]
+        check(f"payload solo {{id, h}}: {sorted(payload)}", set(payload) == {"id", "h"})
+        check(f"ningún campo oculto por _quote_public en el token {filtrados or ''}", not filtrados)
+
+        print("\n=== SEND ===")
+        antes = B.quote_preview_cache.stats()
+        r = c.post("/api/quote/send", json={**body, "quote_token": token})
+        check("send 200", r.status_code == 200)
+        despues = B.quote_preview_cache.stats()
+        check("usa el preview guardado", despues["mem_hits"] == antes["mem_hits"] + 1)
+        check("sin miss de más", despues["misses"] == antes["misses"])
+        qid = r.json()["quote"]["id"]
+        with Session(B.engine) as s:
+            q = s.get(dbQuote, qid)
+            check("persiste el monto del preview", q.monto_estimado == res["quote"]["monto_estimado"])
+            check("persiste los costos internos", q.costo_chofer_parcial is not None and q.mantenimiento is not None)
+
+        antes = B.quote_preview_cache.stats()
+        r = c.post("/api/quote/send", json={**body, "peajes": 0, "quote_token": token})
+        despues = B.quote_preview_cache.stats()
+        check("inputs cambiados: recalcula (no usa el preview)",
+              r.status_code == 200 and despues["mem_hits"] == antes["mem_hits"])
+
+        antes = B.quote_preview_cache.stats()
+        check("hash distinto: no devuelve el preview", B.quote_preview_cache.get(payload["id"], "otro-hash") is None)
+        despues = B.quote_preview_cache.stats()
+        check("hash distinto: un solo miss y ningún hit",
+              despues["misses"] == antes["misses"] + 1 and despues["mem_hits"] == antes["mem_hits"])
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -32,6 +32,9 @@ migrations = [
     ("quotes", "fecha_hora_preferida", "TEXT"),
     ("users", "failed_logins", "INTEGER DEFAULT 0"),
     ("users", "lock_until", "TIMESTAMP"),
+    ("bookings", "duration_min", "INTEGER DEFAULT 60"),
+    ("slot_holds", "client", "TEXT"),
+    ("slot_holds", "duration_min", "INTEGER DEFAULT 60"),
 ]
 
 def main():
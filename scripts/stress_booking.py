@@ -0,0 +1,75 @@
+"""
+Stress de concurrencia de reservas: N clientes mandan /api/quote/send al mismo
+(fecha, hora) a la vez. Tiene que haber exactamente UNA reserva y el resto 409.
+
+Usa una base SQLite temporal y ruteo heurístico (sin APIs externas), salvo que se
+pase DATABASE_URL explícito (ej. un Postgres de pruebas, NUNCA el de producción).
+
+Ejecutar: python scripts/stress_booking.py [clientes] [rondas]
+"""
+import os
+import sys
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from threading import Barrier
+
+if not os.getenv("STRESS_DATABASE_URL"):
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/stress.db"
+else:
+    os.environ["DATABASE_URL"] = os.environ["STRESS_DATABASE_URL"]
+os.environ["GOOGLE_MAPS_API_KEY"] = ""
+os.environ["ORS_API_KEY"] = ""
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+import backend.backend as B
+from backend.models.models import dbBooking, dbQuote
+
+
+def main():
+    clientes = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    rondas = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    ok = True
+
+    with TestClient(B.app) as c:
+        B.limiter.enabled = False  # el rate limit por IP no es lo que se prueba acá
+        base = datetime.now(timezone(timedelta(hours=-3))).date() + timedelta(days=30)
+
+        for r in range(rondas):
+            fecha = (base + timedelta(days=r)).isoformat()
+            hora = B.DEFAULT_SLOTS[r % len(B.DEFAULT_SLOTS)]
+            barrera = Barrier(clientes)
+
+            def enviar(i):
+                body = {
+                    "nombre": f"Stress {i}", "telefono": f"351{i:07d}",
+                    "origen": f"Calle {i} 100", "destino": f"Calle {i} 200",
+                    "fecha_turno": fecha, "hora_turno": hora, "accepted_terms": True,
+                }
+                barrera.wait()
+                return c.post("/api/quote/send", json=body).status_code
+
+            with ThreadPoolExecutor(max_workers=clientes) as pool:
+                codigos = Counter(pool.map(enviar, range(clientes)))
+
+            with Session(B.engine) as s:
+                activos = s.exec(select(dbBooking).where(
+                    dbBooking.date == fecha, dbBooking.time == hora,
+                    dbBooking.status.in_(["reserved", "confirmed"]),
+                )).all()
+                huerfanos = [b for b in activos if not b.quote_id.isdigit() or not s.get(dbQuote, int(b.quote_id))]
+
+            bien = codigos.get(200) == 1 and codigos.get(409) == clientes - 1 and len(activos) == 1 and not huerfanos
+            ok = ok and bien
+            print(f"  [{'OK' if bien else 'ERR'}] {fecha} {hora}: respuestas={dict(codigos)} bookings_activos={len(activos)} huerfanos={len(huerfanos)}")
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()